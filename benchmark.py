@@ -0,0 +1,136 @@
+import calendarcreator
+import example
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# modules which must not be loaded by "import calendarcreator"
+HEAVY_MODULES = ["PIL", "numpy", "scipy", "pikepdf", "concurrent.futures", "picturestore"]
+
+STARTUP_SCRIPT = r'''
+import sys, time
+start = time.perf_counter()
+import calendarcreator
+t_import = time.perf_counter() - start
+calcreate = calendarcreator.CalendarCreator()
+calcreate.texfolder = sys.argv[1]
+calcreate.create_page(2026, "Januar", None, compile=False)
+t_empty_page = time.perf_counter() - start
+heavy = [m for m in sys.argv[3:] if m in sys.modules]
+calcreate.create_page(2026, "Februar", sys.argv[2], compile=False)
+t_first_page = time.perf_counter() - start
+print(t_import, t_empty_page, t_first_page, ",".join(heavy))
+'''
+
+
+def benchmark_weekly_planner(year, njobs, picfolder="pictures"):
+    """Build a full weekly planner and print the time needed for each stage.
+
+    Args:
+        year: Year of the planner
+        njobs: Number of lualatex processes running at the same time
+        picfolder: Folder with the example pictures
+    """
+    pics = example.create_pic_list(picfolder)
+
+    calcreate = calendarcreator.CalendarCreator()
+    calcreate.set_page_size(23, 17)
+    calcreate.set_margin(0.3)
+    calcreate.set_shiftdict(example.get_shift_dictionary(picfolder))
+    calcreate.set_title(r"Planner {}".format(year), picfolder + os.sep + "p22.jpg",
+                        [0.9, 17/2.0], "north west")
+    calcreate.footer_over_pic = True
+    calcreate.texfolder = "texfiles_benchmark"
+    calcreate.calendar_filename = "planner_benchmark.pdf"
+    calcreate.njobs = njobs
+
+    if not os.path.exists(calcreate.texfolder):
+        os.mkdir(calcreate.texfolder)
+
+    start = time.perf_counter()
+    calcreate.preflight()
+    t_preflight = time.perf_counter() - start
+
+    # latex generation only, this is what the planner does before compiling
+    start = time.perf_counter()
+    weeks = calcreate.get_weeks(year)
+    header = calcreate.get_header()
+    for i, days in enumerate(weeks):
+        calcreate.create_week_page(year, days, pics[i % len(pics)], header=header, compile=False)
+    t_tex = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calcreate.create_weekly_planner(pics, year)
+    t_total = time.perf_counter() - start
+
+    npages = len(weeks) + 1
+    print("")
+    print("Weekly planner {}: {} pages, {} jobs".format(year, npages, njobs))
+    print("  preflight:          {:8.2f} s".format(t_preflight))
+    print("  latex generation:   {:8.3f} s".format(t_tex))
+    print("  full build:         {:8.2f} s ({:.2f} s per page)".format(t_total, t_total / npages))
+    print("  output size:        {:8.2f} MB".format(os.path.getsize(calcreate.calendar_filename) / 1e6))
+
+
+def benchmark_startup(repeat=5, max_import_ms=None, max_first_page_ms=None, picfolder="pictures"):
+    """Measure import time and latency until the first latex page is written in a new process.
+
+    Each measurement runs in a fresh python process, the best of "repeat" runs is reported.
+
+    Args:
+        repeat: Number of processes started
+        max_import_ms: If given, fail if importing calendarcreator takes longer
+        max_first_page_ms: If given, fail if writing the first page with a picture takes longer
+        picfolder: Folder with the example pictures
+    Returns:
+        True if no limit is exceeded and no heavy module is loaded at import time
+    """
+    texfolder = "texfiles_benchmark"
+    if not os.path.exists(texfolder):
+        os.mkdir(texfolder)
+
+    results = []
+    for i in range(repeat):
+        out = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT, texfolder,
+                                       picfolder + os.sep + "p01.jpg"] + HEAVY_MODULES)
+        values = out.decode().splitlines()[-1].split()
+        results.append([1000 * float(v) for v in values[:3]] + [values[3] if len(values) > 3 else ""])
+
+    t_import = min([r[0] for r in results])
+    t_empty_page = min([r[1] for r in results])
+    t_first_page = min([r[2] for r in results])
+    heavy = results[0][3]
+
+    print("")
+    print("Startup (best of {} processes)".format(repeat))
+    print("  import calendarcreator:        {:8.1f} ms".format(t_import))
+    print("  first page without picture:    {:8.1f} ms".format(t_empty_page))
+    print("  first page with picture:       {:8.1f} ms".format(t_first_page))
+    print("  heavy modules after import:    {}".format(heavy if heavy else "none"))
+
+    ok = len(heavy) == 0
+    if max_import_ms is not None and t_import > max_import_ms:
+        print("  import time exceeds {} ms".format(max_import_ms))
+        ok = False
+    if max_first_page_ms is not None and t_first_page > max_first_page_ms:
+        print("  first page latency exceeds {} ms".format(max_first_page_ms))
+        ok = False
+    return ok
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Calendar creator benchmarks")
+    parser.add_argument("benchmark", choices=["planner", "startup"], nargs="?", default="planner")
+    parser.add_argument("--year", type=int, default=2026)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--max-import-ms", type=float, default=None)
+    parser.add_argument("--max-first-page-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.benchmark == "planner":
+        benchmark_weekly_planner(args.year, args.jobs)
+    elif not benchmark_startup(max_import_ms=args.max_import_ms, max_first_page_ms=args.max_first_page_ms):
+        sys.exit(1)
@@ -6,8 +6,20 @@ import subprocess
 import random
 import calendar
 import datetime
+import re
+import json
+import queue
+import threading
+import io
+import hashlib
+import shutil
+import tempfile
+import time
 from contextlib import contextmanager
-from PIL import Image, ExifTags
+
+# PIL, pikepdf, numpy and the concurrent.futures machinery are imported in the
+# functions which need them, such that importing this module and writing latex
+# files stays fast for short-lived processes.
 
 class CalendarCreator:
 
@@ -24,6 +36,8 @@ class CalendarCreator:
         # self.year = datetime.datetime.now().year + 1
         self.texfolder = "texfiles"
         self.calendar_filename = "calendar.pdf"
+        self.scratch_folder = None # if set, texfolder is replaced by a temporary folder inside of it
+        self.absolute_picture_paths = False
 
         self.page_width = 21.0
         self.page_height = 21.0
@@ -53,6 +67,31 @@ class CalendarCreator:
 
         self.theme = "light" # "dark"
 
+        self.events = None
+
+        self.picture_store = None
+        self._shift_by_hash = {}
+
+        self.image_map = {} # picture -> resized picture actually included (see fit_images())
+        self.page_overhead = 0.05 # estimated size of a page without pictures in MB
+        self.max_dpi = 300
+
+        self.output_profiles = {}
+
+        self.source_date_epoch = None # if set, PDFs are reproducible (see set_reproducible())
+        self.linearize = False # write calendar as linearized pdf ("fast web view")
+        # latex color used for the day numbers for each event category
+        self.event_styles = {"holiday" : "holiday", "birthday" : "birthday", "event" : "event"}
+
+        self.font = "Linux Biolinum O"
+        self.merge_tool = "pdfunite"
+        self._preflight_done = False
+        self.njobs = 1 # number of lualatex processes running at the same time
+        self.memory_budget = None # memory in MB for all lualatex processes, None: available memory
+        self.memory_stats_file = ".lualatex_memory.json"
+        self.min_memory = 50.0 # lower bound in MB for the estimated memory of one lualatex process
+        self.peak_memory = {} # latex filename -> peak memory in MB of the last compile
+
     def set_shiftdict(self, shiftdict):
         self.shiftdict = shiftdict
 
@@ -105,6 +144,182 @@ class CalendarCreator:
             exit(1)
         self.legends = legends
 
+    def set_picture_store(self, indexfile=".picturestore.json", njobs=None):
+        """Use a persistent picture index for picture sizes and rotations.
+
+        With a picture store, each picture is only opened once as long as it does not
+        change, also over several runs. The store is also used to find identical pictures
+        stored under different paths (see check_pictures()).
+
+        Args:
+            indexfile: File where the index is stored.
+            njobs: Number of pictures hashed at the same time (default: number of cpus)
+        """
+        from picturestore import PictureStore
+        self.picture_store = PictureStore(indexfile, self.read_image_size_and_rotation, njobs)
+
+    def get_picture_list(self, pics):
+        """Get all picture filenames of a calendar.
+
+        Args:
+            pics: Pictures as given to create_calendar()
+        Returns:
+            List with all picture filenames used for the pages and the title page (without
+            layout options and without None entries).
+        """
+        filenames = []
+        if self.titlepic is not None:
+            filenames.append(self.titlepic)
+        for monthpics in pics:
+            if monthpics is None:
+                continue
+            elif type(monthpics) is list:
+                filenames.extend([p for p in monthpics if p not in self.picoptions])
+            else:
+                filenames.append(monthpics)
+        return filenames
+
+    def check_pictures(self, pics):
+        """Find identical pictures stored under different paths.
+
+        All pictures are added to the picture store (new pictures are hashed in parallel).
+        Identical pictures in the picture lists and in "shiftdict" are reported and
+        pictures which are not in "shiftdict" by their path use the shift of an identical
+        picture which is in "shiftdict".
+
+        Args:
+            pics: Pictures as given to create_calendar()
+        Returns:
+            Dictionary with hash as key and list of filenames with identical content as value.
+        """
+        if self.picture_store is None:
+            self.set_picture_store()
+
+        filenames = self.get_picture_list(pics)
+        shiftnames = [p for p in self.shiftdict if os.path.exists(p)]
+        duplicates = self.picture_store.find_duplicates(filenames + shiftnames)
+
+        self._shift_by_hash = {}
+        for pn in shiftnames:
+            self._shift_by_hash[self.picture_store.get_hash(pn)] = self.shiftdict[pn]
+
+        for paths in duplicates.values():
+            print("Identical pictures: " + ", ".join(paths))
+            shifts = set([self.shiftdict[p] for p in paths if p in self.shiftdict])
+            if len(shifts) > 1:
+                print("  Warning: different shifts given for identical pictures: {}".format(sorted(shifts)))
+        return duplicates
+
+    def use_scratch_folder(self, scratch_folder="auto"):
+        """Do all intermediate work in a scratch folder, e.g. on a tmpfs.
+
+        During create_calendar() and create_weekly_planner(), latex files, logs, page PDFs
+        and resized pictures are written to a new temporary folder inside "scratch_folder"
+        instead of "texfolder". Pictures are included with their absolute path. Only
+        "calendar_filename" (and the output profiles) are written to their destination.
+        The temporary folder is removed afterwards.
+
+        Args:
+            scratch_folder: Folder in which the temporary folder is created. "auto" uses
+               /dev/shm if it exists and the default temporary folder otherwise. None
+               switches the scratch folder off again.
+        """
+        if scratch_folder == "auto":
+            if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+                scratch_folder = "/dev/shm"
+            else:
+                scratch_folder = tempfile.gettempdir()
+        self.scratch_folder = scratch_folder
+
+    @contextmanager
+    def build_folder(self):
+        """Context in which "texfolder" points to the folder where the pages are built.
+
+        Without a scratch folder, nothing changes. Otherwise a temporary folder is created
+        inside "scratch_folder", used as "texfolder" and removed when the context is left.
+        """
+        if self.scratch_folder is None:
+            yield
+            return
+
+        prev_texfolder = self.texfolder
+        prev_absolute = self.absolute_picture_paths
+        self.texfolder = tempfile.mkdtemp(prefix="calendarcreator_", dir=self.scratch_folder)
+        self.absolute_picture_paths = True
+        try:
+            yield
+        finally:
+            shutil.rmtree(self.texfolder, ignore_errors=True)
+            self.texfolder = prev_texfolder
+            self.absolute_picture_paths = prev_absolute
+            self.image_map = {}
+
+    def auto_layout(self, photos, num_months=12, photos_per_month=None):
+        """Choose layouts and assign photos to the months automatically.
+
+        The photos are assigned such that as little as possible of them is cropped away
+        (see layoutoptimizer.LayoutOptimizer). Default shifts for photos cut at top and
+        bottom are added to "shiftdict" (see LayoutOptimizer.build_result()), shifts which
+        are already set are kept. The aspect ratios are taken from the picture store, which
+        is opened with its default index file if none is set. This needs numpy and scipy.
+
+        Args:
+            photos: List with photo filenames to choose from
+            num_months: Number of calendar pages
+            photos_per_month: Average number of photos per month (None: as many as possible,
+               at most four per month)
+        Returns:
+            pics list which can be passed to create_calendar()
+        """
+        from layoutoptimizer import LayoutOptimizer
+
+        if self.picture_store is None:
+            self.set_picture_store()
+        pics, shifts, cropped = LayoutOptimizer(self).optimize(photos, num_months, photos_per_month)
+        for picname, shift in shifts.items():
+            self.shiftdict.setdefault(picname, shift)
+        print("Automatic layout: {} months, {:.1f}% of the photo area cropped on average".format(
+            len(pics), 100 * cropped))
+        return pics
+
+    def set_events(self, events, styles=None):
+        """Set events which are marked in the numbering.
+
+        Args:
+            events: events.EventCalendar with all holidays, birthdays, ... which should be marked.
+            styles: Dictionary which maps the event categories to latex colors (e.g.
+               {"holiday" : "red", "birthday" : "birthday"}). The colors "holiday", "birthday"
+               and "event" are defined by the color theme. Categories which are not in the
+               dictionary use the color "event".
+        """
+        self.events = events
+        if styles is not None:
+            self.event_styles = styles
+
+    def get_day_color(self, color, day, events):
+        """Get the color of a day number.
+
+        Args:
+            color: Color if there is no event on this day ("weekday" or "sunday")
+            day: Date of the day (datetime.date)
+            events: Dictionary with events as returned by EventCalendar.get_range()
+        Returns:
+            Color of the first event on this day according to "event_styles" or the given color.
+        """
+        if day in events:
+            return self.event_styles.get(events[day][0].category, "event")
+        return color
+
+    def get_events(self, first, last):
+        """Get all events between two dates.
+
+        Returns:
+            Dictionary as returned by EventCalendar.get_range(), empty if no events are set.
+        """
+        if self.events is None:
+            return {}
+        return self.events.get_range(first, last)
+
     def set_title(self, title=None,pic=None,pos=None,anchor="center",opacity=0.7):
         self.title = title
         self.titlepic = pic
@@ -112,6 +327,20 @@ class CalendarCreator:
         self.titleanchor = anchor
         self.titleopacity = opacity
 
+    def set_reproducible(self, source_date_epoch=0):
+        """Create byte-identical PDFs for identical input.
+
+        lualatex uses the given date instead of the current time for creation date,
+        modification date and document ID, and does not write the latex and picture
+        filenames into the PDF. The pages are joined with pikepdf (instead of "merge_tool")
+        using a document ID computed from the content.
+
+        Args:
+            source_date_epoch: Date written to the PDFs in seconds since 1970-01-01,
+               None switches reproducible output off again.
+        """
+        self.source_date_epoch = source_date_epoch
+
     def set_page_size(self, width, height):
         self.page_width = width
         self.page_height = height
@@ -206,22 +435,31 @@ class CalendarCreator:
 
         tmp, last_day_prev_month = calendar.monthrange(prev_month_year, prev_month_idx)
 
+        first_day = datetime.date(year, monthidx, 1)
+        last_day = datetime.date(year, monthidx, ndays)
+        events = self.get_events(first_day - datetime.timedelta(days=firstoffset),
+                                 last_day + datetime.timedelta(days=nweeks_in_line*7))
+
         weekday = self.days[0]
         pos = 0
         for daynum in range(last_day_prev_month-firstoffset+1, last_day_prev_month+1):
+            day = first_day - datetime.timedelta(days=last_day_prev_month-daynum+1)
             if weekday == "So":
-                numstring += r"\color{sunday!30!footerbackgroundcolor}"
+                color = self.get_day_color("sunday", day, events)
             else:
-                numstring += r"\color{weekday!30!footerbackgroundcolor}"
+                color = self.get_day_color("weekday", day, events)
+            numstring += r"\color{" + color + "!30!footerbackgroundcolor}"
             numstring += " {} &".format(daynum)
             weekday = self.get_next_weekday(weekday)
 
         pos = firstoffset
         for daynum in range(1,ndays+1):
+            day = datetime.date(year, monthidx, daynum)
             if weekday == "So":
-                numstring += r"\color{sunday}"
+                color = self.get_day_color("sunday", day, events)
             else:
-                numstring += r"\color{weekday}"
+                color = self.get_day_color("weekday", day, events)
+            numstring += r"\color{" + color + "}"
             numstring += r" {} &".format(daynum)
             pos += 1
             weekday = self.get_next_weekday(weekday)
@@ -230,10 +468,12 @@ class CalendarCreator:
                 pos = 0
 
         for daynum in range(1, nweeks_in_line*7 - pos + 1):
+            day = last_day + datetime.timedelta(days=daynum)
             if weekday == "So":
-                numstring += r"\color{sunday!30!footerbackgroundcolor}"
+                color = self.get_day_color("sunday", day, events)
             else:
-                numstring += r"\color{weekday!30!footerbackgroundcolor}"
+                color = self.get_day_color("weekday", day, events)
+            numstring += r"\color{" + color + "!30!footerbackgroundcolor}"
             numstring += " {} &".format(daynum)
             weekday = self.get_next_weekday(weekday)
 
@@ -242,6 +482,70 @@ class CalendarCreator:
         numstring += r"  };" + "\n"
         return numstring
 
+    def get_weeks(self, year):
+        """Get the days of all calendar weeks of a year.
+
+        Weeks are counted according to ISO 8601, i.e. week 1 is the week containing the
+        4th of January and weeks start on Monday.
+
+        Args:
+            year: Year for which the weeks are computed.
+        Returns:
+            List with one entry per week (52 or 53 entries), each entry is a list
+            with the seven datetime.date objects from Monday to Sunday.
+        """
+        first = datetime.date(year, 1, 4)
+        monday = first - datetime.timedelta(days=first.weekday())
+        weeks = []
+        while monday.isocalendar()[0] == year:
+            weeks.append([monday + datetime.timedelta(days=i) for i in range(7)])
+            monday = monday + datetime.timedelta(days=7)
+        return weeks
+
+    def create_week_numbering(self, year, days, page_pos=[0.5,1], anchor="south west"):
+        """Create the numbering and weekdays of one week.
+
+        Args:
+            year: Year of the planner. Days outside of this year are printed faded.
+            days: List with seven datetime.date objects from Monday to Sunday as
+               returned by get_weeks().
+            page_pos: List with two value which define the position of the numbering
+               on the page (x and y value in cm).
+            anchor: Anchor according to latex tikz, of the numbering which should be
+               aligned with the page_pos. (e.g. "south west", "center", "north east" ,...)
+        Returns:
+            Latex string which can be written into a latex file tikzpicture environment to
+            create the numbering.
+        """
+        numstring = r"""  %%% create_week_numbering:
+        \matrix (days) at ({},{}) [
+        anchor={},matrix of nodes,column sep=0.3cm,nodes={{font=\Large}}] {{
+        """.format(page_pos[0], page_pos[1], anchor)
+
+        for d in self.days:
+            if d == "So":
+                numstring += r"\color{sunday}"
+            else:
+                numstring += r"\color{weekday}"
+            numstring += r" \bfseries " + d + " &"
+        numstring = numstring[:-1] + r"\\" + "\n"
+        numstring += "    "
+
+        events = self.get_events(days[0], days[-1])
+        for weekday, day in zip(self.days, days):
+            if weekday == "So":
+                color = self.get_day_color("sunday", day, events)
+            else:
+                color = self.get_day_color("weekday", day, events)
+            if day.year != year:
+                color += "!30!footerbackgroundcolor"
+            numstring += r"\color{" + color + "}"
+            numstring += " {}.{}. &".format(day.day, day.month)
+
+        numstring = numstring[:-1] + r"\\" + "\n"
+        numstring += r"  };" + "\n"
+        return numstring
+
     def get_colortheme(self):
         if self.theme == "light":
             themetext = """% color theme
@@ -250,6 +554,9 @@ class CalendarCreator:
     \colorlet{weekday}{black}
     \colorlet{month}{black} %blue!50!green}
     \colorlet{title}{white}
+    \colorlet{holiday}{red!70!black}
+    \colorlet{birthday}{orange!90!black}
+    \colorlet{event}{violet}
 """
         elif self.theme == "dark":
             themetext = """% color theme
@@ -258,6 +565,9 @@ class CalendarCreator:
     \colorlet{weekday}{white}
     \colorlet{month}{white} %blue!50!green}
     \colorlet{title}{white}
+    \colorlet{holiday}{red!80!white}
+    \colorlet{birthday}{orange}
+    \colorlet{event}{violet!60!white}
 """
         else:
             print("Invalid theme: " + self.theme)
@@ -274,7 +584,7 @@ class CalendarCreator:
     \documentclass[tikz]{standalone}
 
     \usepackage{fontspec}
-    \setmainfont[BoldFont=* Bold,Numbers={OldStyle}]{Linux Biolinum O}
+    \setmainfont[BoldFont=* Bold,Numbers={OldStyle}]{""" + self.font + r"""}
     \usepackage{graphicx}
     \usepackage[ngerman]{babel}
     \usepackage{csquotes}
@@ -286,6 +596,15 @@ class CalendarCreator:
 
       \begin{tikzpicture}
     """
+        if self.source_date_epoch is not None:
+            # no banner, file names and generated ID in the pdf: luatex computes the ID from
+            # the current time, working directory and file name (e.g. of a temporary build
+            # folder), so a fixed ID is written instead
+            trailerid = hashlib.md5("calendarcreator {}".format(
+                int(self.source_date_epoch)).encode()).hexdigest().upper()
+            headtext = (r"\pdfvariable suppressoptionalinfo 515" + "\n"
+                        + r"\pdfvariable trailerid {{[<{0}> <{0}>]}}".format(trailerid) + "\n"
+                        + headtext)
         if not self._show_margin:
             tm = 0.0
             bm = 0.0
@@ -363,11 +682,35 @@ class CalendarCreator:
     def get_image_size_and_rotation(self, picname):
         """Find out the size and rotation of the picture.
 
+        If a picture store is set (see set_picture_store()), the values are taken from there.
+        Pictures written by this program into "texfolder" (see fit_images()) are not added
+        to the store, they are read directly.
+
+        Args:
+            picname: Filename of picture
+        Returns:
+            size in pixels as list [width, height], rotation in degree (0, 90, 180 or 270)
+        """
+        if self.picture_store is not None and not self.is_generated_picture(picname):
+            entry = self.picture_store.get(picname)
+            return list(entry["imsize"]), entry["rotation"]
+        return self.read_image_size_and_rotation(picname)
+
+    def is_generated_picture(self, picname):
+        """Check if a picture is a resized copy inside "texfolder", see fit_images()."""
+        texfolder = os.path.abspath(self.texfolder)
+        return os.path.commonpath([texfolder, os.path.abspath(picname)]) == texfolder
+
+    def read_image_size_and_rotation(self, picname):
+        """Read size and rotation of the picture from the picture file.
+
         Args:
             picname: Filename of picture
         Returns:
             size in pixels as list [width, height], rotation in degree (0, 90, 180 or 270)
         """
+        from PIL import Image, ExifTags
+
         orientmap = {}
         orientmap[3] = 180
         orientmap[Image.ROTATE_270] = 270
@@ -422,11 +765,17 @@ class CalendarCreator:
             Picture code, which is written to a latexfile (latex file should be in texfolder to match the picture path)x
         """
 
-        # Find relative path of picture based on latex folder
-        abs_pic_path = os.path.dirname(os.path.abspath(picname))
-        abs_latex_path = os.path.abspath(self.texfolder)
-        rel_picpath_latex = os.path.relpath(abs_pic_path, abs_latex_path)
-        pic_latex = rel_picpath_latex + os.sep + os.path.basename(picname)
+        # Use the resized picture if there is one
+        picname = self.image_map.get(picname, picname)
+
+        if self.absolute_picture_paths:
+            pic_latex = os.path.abspath(picname)
+        else:
+            # Find relative path of picture based on latex folder
+            abs_pic_path = os.path.dirname(os.path.abspath(picname))
+            abs_latex_path = os.path.abspath(self.texfolder)
+            rel_picpath_latex = os.path.relpath(abs_pic_path, abs_latex_path)
+            pic_latex = rel_picpath_latex + os.sep + os.path.basename(picname)
 
         imsize, rotate = self.get_image_size_and_rotation(picname)
 
@@ -485,6 +834,179 @@ class CalendarCreator:
         return pc
 
 
+    def get_rendered_size(self, picname, width, height, lmargin, rmargin, tmargin, bmargin):
+        """Get the size of a picture as it is drawn by get_pic() (before clipping).
+
+        Args:
+            See get_pic().
+        Returns:
+            Size of the drawn picture in cm as list [width, height]
+        """
+        imsize, rotate = self.get_image_size_and_rotation(picname)
+        totwidth = width+lmargin+rmargin
+        totheight = height+tmargin+bmargin
+        if totwidth / totheight < float(imsize[0]) / float(imsize[1]):
+            return [imsize[0] / float(imsize[1]) * totheight, totheight]
+        else:
+            return [totwidth, imsize[1] / float(imsize[0]) * totwidth]
+
+    def get_placements(self, pics):
+        """Get all pictures of a calendar together with their size on the pages.
+
+        Args:
+            pics: Pictures as given to create_calendar()
+        Returns:
+            List with one entry per page (the first one is the title page). Each entry
+            is a list with [picname, width, height] for each picture, where width and height
+            are the drawn size in cm.
+        """
+        pageslots = []
+        if self.titlepic is not None:
+            pageslots.append([self.get_titlepic_slot()])
+        else:
+            pageslots.append([])
+        for monthpics in pics:
+            pageslots.append(self.get_pic_slots(monthpics))
+
+        pages = []
+        for slots in pageslots:
+            pages.append([[slot[0]] + self.get_rendered_size(slot[0], *slot[2:8]) for slot in slots])
+        return pages
+
+    def encode_picture(self, picname, scale, quality):
+        """Resize and compress a picture in memory.
+
+        The picture is rotated according to its exif orientation, such that the result
+        does not need any rotation.
+
+        Args:
+            picname: Filename of the picture
+            scale: Factor for width and height (<= 1)
+            quality: JPEG quality (1 - 95)
+        Returns:
+            JPEG data
+        """
+        from PIL import Image, ImageOps
+
+        im = Image.open(picname)
+        imsize = [int(max(1, round(scale * im.size[0]))), int(max(1, round(scale * im.size[1])))]
+        # let the jpeg decoder do most of the down scaling
+        im.draft("RGB", imsize)
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        target = [imsize[0], imsize[1]]
+        if (im.size[0] > im.size[1]) != (target[0] > target[1]):
+            target.reverse()
+        if im.size[0] > target[0]:
+            im = im.resize(target, Image.LANCZOS)
+        out = io.BytesIO()
+        im.save(out, "JPEG", quality=quality, optimize=True)
+        return out.getvalue()
+
+    def fit_picture(self, picname, drawn_size, budget):
+        """Find resolution and JPEG quality of a picture such that it fits into a size budget.
+
+        The resolution is reduced in steps from "max_dpi" (relative to the drawn size of
+        the picture) and for each resolution the highest JPEG quality which fits into the
+        budget is found by bisection. Only encoding in memory is done, there is no
+        latex compile involved.
+
+        Args:
+            picname: Filename of the picture
+            drawn_size: Size of the picture on the page in cm [width, height]
+            budget: Maximum number of bytes for this picture
+        Returns:
+            Tuple with (jpeg data or None if the original picture can be used, dpi, quality)
+        """
+        imsize, rotate = self.get_image_size_and_rotation(picname)
+        native_dpi = imsize[0] / (drawn_size[0] / 2.54)
+        if native_dpi <= self.max_dpi and os.path.getsize(picname) <= budget:
+            return None, native_dpi, None
+
+        qualities = [35, 45, 55, 65, 75, 85, 92]
+        data = None
+        for dpi in [self.max_dpi, 240, 200, 150, 120, 96, 72]:
+            if dpi > min(native_dpi, self.max_dpi) and dpi != self.max_dpi:
+                continue
+            scale = min(1.0, dpi / native_dpi)
+            lo, hi = 0, len(qualities) - 1
+            best = None
+            while lo <= hi:
+                mid = (lo + hi) // 2
+                enc = self.encode_picture(picname, scale, qualities[mid])
+                if len(enc) <= budget:
+                    best = (enc, min(dpi, native_dpi), qualities[mid])
+                    lo = mid + 1
+                else:
+                    hi = mid - 1
+                    if data is None or len(enc) < len(data[0]):
+                        data = (enc, min(dpi, native_dpi), qualities[mid])
+            if best is not None:
+                return best
+        # does not fit at all, use the smallest version
+        return data
+
+    def fit_images(self, pics, max_size=None, max_page_size=None):
+        """Choose resolution and quality of all pictures such that the calendar fits into a size budget.
+
+        The budget (after subtracting "page_overhead" for each page) is distributed to the
+        pictures according to their drawn area. The resized pictures are written to
+        texfolder/images and used by get_pic() through "image_map".
+
+        Args:
+            pics: Pictures as given to create_calendar()
+            max_size: Maximum size of the whole calendar in MB (or None)
+            max_page_size: Maximum size of each page in MB (or None)
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        placements = self.get_placements(pics)
+        npages = len(placements)
+
+        budgets = {}
+        def add_budget(picname, nbytes):
+            budgets[picname] = min(budgets.get(picname, nbytes), nbytes)
+
+        if max_size is not None:
+            total_area = sum([p[1] * p[2] for page in placements for p in page])
+            available = (max_size - npages * self.page_overhead) * 1e6
+            for page in placements:
+                for p in page:
+                    add_budget(p[0], available * p[1] * p[2] / total_area)
+        if max_page_size is not None:
+            available = (max_page_size - self.page_overhead) * 1e6
+            for page in placements:
+                page_area = sum([p[1] * p[2] for p in page])
+                for p in page:
+                    add_budget(p[0], available * p[1] * p[2] / page_area)
+
+        drawn_size = {}
+        for page in placements:
+            for p in page:
+                if p[1] > drawn_size.get(p[0], [0, 0])[0]:
+                    drawn_size[p[0]] = p[1:3]
+
+        imagefolder = self.texfolder + os.sep + "images"
+        if not os.path.exists(imagefolder):
+            os.mkdir(imagefolder)
+
+        picnames = list(budgets.keys())
+        with ThreadPoolExecutor(max_workers=max(1, self.njobs)) as pool:
+            results = list(pool.map(lambda pn: self.fit_picture(pn, drawn_size[pn], max(budgets[pn], 1)), picnames))
+
+        self.image_map = {}
+        print("Picture sizes for budget:")
+        for i, (pn, (data, dpi, quality)) in enumerate(zip(picnames, results)):
+            if data is None:
+                print("  {}: original ({:.0f} dpi, {:.2f} MB)".format(pn, dpi, os.path.getsize(pn) / 1e6))
+                continue
+            outname = imagefolder + os.sep + "{:03d}_{}".format(i, os.path.splitext(os.path.basename(pn))[0]) + ".jpg"
+            with open(outname, "wb") as f:
+                f.write(data)
+            self.image_map[pn] = outname
+            print("  {}: {:.0f} dpi, quality {}, {:.2f} MB".format(pn, dpi, quality, len(data) / 1e6))
+
     def get_monthtext(self, month, year, page_pos=None, anchor="south east"):
         """Get latex text for writing month to calendar page.
 
@@ -503,27 +1025,40 @@ class CalendarCreator:
             page_pos[0],  page_pos[1], anchor, monthtext) + "\n\n"
         return ms
 
-    def create_page(self, year, month, pics):
-        """Create latex text for a complete calendar page with four pictures and the
-        numbering at the bottom.
+    def get_weektext(self, days, page_pos=None, anchor="south east"):
+        """Get latex text for writing the calendar week to a planner page.
 
-        The files will be created inside "texfolder". The name is xx_monthname.tex where xx is
-        01, 02, 03, ... depending on the month and monthname is the month name given.
+        Args:
+            days: List with seven datetime.date objects from Monday to Sunday.
+            page_pos: List with two value which define the position of the week text
+               on the page (x and y value in cm). If None we use [page_width-0.2,0]
+            anchor: Anchor according to latex tikz, of the week text which should be
+               aligned with the page_pos. (e.g. "south west", "center", "north east" ,...)
+        """
+        if page_pos is None:
+            page_pos = [self.page_width-0.2, 0]
+        first_month = self.months[days[0].month-1]
+        last_month = self.months[days[-1].month-1]
+        if first_month == last_month:
+            monthtext = first_month
+        else:
+            monthtext = first_month + "/" + last_month
+        weektext = "KW {} -- {} {}".format(days[0].isocalendar()[1], monthtext, days[-1].year)
+        ws = "  %%% get_weektext\n"
+        ws += r"  \node at ({},{}) [anchor={},font=\scshape,color=month!70!footerbackgroundcolor,scale=2.5,inner sep=0, outer sep=0] {{{}}};".format(
+            page_pos[0],  page_pos[1], anchor, weektext) + "\n\n"
+        return ws
 
-        At the end lualatex will be called on the created file.
+    def get_pic_slots(self, pics):
+        """Find the place of each picture on a calendar page.
 
         Args:
-            year: Year of the month to be created
-            month: Month name according to the global "months"-list for which the page should be created
-            pics: List with four pictures to be placed on the page. Path of the pictures must be
-               relative to the current path where this function is called.
-
-        Returns: pdf filename of calendar page.
+            pics: Picture(s) of one page as given for create_page(), e.g. a single picture
+               or a list of pictures with an optional layout entry from "picoptions".
+        Returns:
+            List with one entry for each picture. Each entry is a tuple with the arguments of
+            get_pic() (picname, center, width, height, lmargin, rmargin, tmargin, bmargin, shift).
         """
-        midx = self.months.index(month) + 1
-        filename = "{:02d}_{}.tex".format(midx,month)
-        outfile = self.texfolder + os.sep + filename
-
         if self.footer_over_pic:
             pic_height = self.page_height
             bottommargin = self.bottommargin
@@ -541,79 +1076,113 @@ class CalendarCreator:
         else:
             pics_optionless = pics
 
-        # print(pics)
+        slots = []
+        if pics is None:
+            pass
+
+        ## One picture
+        elif type(pics) is not list:
+            slots.append((pics, [self.page_width/2.0,self.page_height-pic_height/2.0], self.page_width, pic_height, self.leftmargin, self.rightmargin, self.topmargin, bottommargin, shifts))
+
+        elif "vertical" in pics or "||" in pics:
+            num_pics = len(pics_optionless)
+            pic_width = self.page_width / num_pics
+            for i in range(num_pics):
+                if i == 0:
+                    left_margin_pic = self.leftmargin
+                else:
+                    left_margin_pic = 0.0
+
+                if i == num_pics - 1:
+                    right_margin_pic = self.rightmargin
+                else:
+                    right_margin_pic = self.overlap
+
+                slots.append((pics_optionless[i], [pic_width * (i + 0.5), self.page_height-pic_height/2.0], pic_width, pic_height, left_margin_pic, right_margin_pic, self.topmargin, bottommargin, shifts[i]))
+
+        elif "horizontal" in pics or "=" in pics:
+            num_pics = len(pics_optionless)
+            single_pic_height = pic_height / num_pics
+            for i in range(num_pics):
+                if i == 0:
+                    top_margin_pic = self.topmargin
+                else:
+                    top_margin_pic = 0.0
+
+                if i == num_pics - 1:
+                    bottom_margin_pic = self.bottommargin
+                else:
+                    bottom_margin_pic = self.overlap
+                slots.append((pics_optionless[i], [self.page_width/2.0,self.page_height-single_pic_height * (i + 0.5)], self.page_width, single_pic_height, self.leftmargin, self.rightmargin, top_margin_pic, bottom_margin_pic, shifts[i]))
+
+        elif len(pics_optionless) == 4 and "||=" in pics:
+            width_h = 0.45 * self.page_width
+            width_v = (self.page_width - width_h) / 2
+            height_h = pic_height / 2
+            height_v = pic_height
+            # first vertical
+            slots.append((pics_optionless[0], [width_v / 2,self.page_height - 0.5 * pic_height], width_v, height_v, self.leftmargin, self.overlap, self.topmargin, self.bottommargin, shifts[0]))
+            # second vertical
+            slots.append((pics_optionless[1], [width_v * 3 / 2,self.page_height - 0.5 * pic_height], width_v, height_v, 0, self.overlap, self.topmargin, self.bottommargin, shifts[1]))
+            # first horizontal
+            slots.append((pics_optionless[2], [2*width_v + width_h/2,self.page_height - pic_height / 4], width_h, height_h, 0, self.rightmargin, self.topmargin, self.overlap, shifts[2]))
+            # second horizontal
+            slots.append((pics_optionless[3], [2*width_v + width_h/2,self.page_height - pic_height * 3.0 / 4.0], width_h, height_h, 0, self.rightmargin, 0, self.bottommargin, shifts[3]))
+
+        ## Four pictures
+        elif len(pics) == 4:
+            # north west pic
+            slots.append((pics[0], [self.page_width/4.0,self.page_height-pic_height/4.0], self.page_width/2.0, pic_height/2.0, self.leftmargin, self.overlap, self.topmargin, self.overlap, shifts[0]))
+
+            # north east pic
+            slots.append((pics[1], [3.0*self.page_width/4.0,self.page_height-pic_height/4.0], self.page_width/2.0, pic_height/2.0, 0.0, self.rightmargin, self.topmargin, self.overlap, shifts[1]))
+
+            # south west pic
+            slots.append((pics[2], [self.page_width/4.0,self.page_height-3.0*pic_height/4.0], self.page_width/2.0, pic_height/2.0, self.leftmargin, self.overlap, 0.0, bottommargin, shifts[2]))
+
+            # south east pic
+            slots.append((pics[3], [3.0*self.page_width/4.0,self.page_height-3.0*pic_height/4.0], self.page_width/2.0, pic_height/2.0, 0.0, self.rightmargin, 0.0, bottommargin, shifts[3]))
+        else:
+            print("Currently only a single pic or a list of four pics can be put on one page")
+            exit(1)
+        return slots
+
+    def get_pics(self, pics):
+        """Create latex string for all pictures of a calendar page.
+
+        Args:
+            pics: Picture(s) of one page as given for create_page()
+        Returns:
+            Picture code for all pictures (see get_pic())
+        """
+        return "".join([self.get_pic(*slot) for slot in self.get_pic_slots(pics)])
+
+    def create_page(self, year, month, pics, compile=True):
+        """Create latex text for a complete calendar page with four pictures and the
+        numbering at the bottom.
+
+        The files will be created inside "texfolder". The name is xx_monthname.tex where xx is
+        01, 02, 03, ... depending on the month and monthname is the month name given.
+
+        At the end lualatex will be called on the created file.
+
+        Args:
+            year: Year of the month to be created
+            month: Month name according to the global "months"-list for which the page should be created
+            pics: List with four pictures to be placed on the page. Path of the pictures must be
+               relative to the current path where this function is called.
+            compile: If False, only the latex file is written and lualatex is not called.
+               The page can then be compiled later with compile_pages().
+
+        Returns: pdf filename of calendar page.
+        """
+        midx = self.months.index(month) + 1
+        filename = "{:02d}_{}.tex".format(midx,month)
+        outfile = self.texfolder + os.sep + filename
+
         with open(outfile,"w") as f:
             f.write(self.get_header())
-            #f.write(get_pics("pic1", "pic2", "pic3", "pic4"))
-
-            if pics is None:
-                pass
-
-            ## One picture
-            elif type(pics) is not list:
-                f.write(self.get_pic(pics, [self.page_width/2.0,self.page_height-pic_height/2.0], self.page_width, pic_height, self.leftmargin, self.rightmargin, self.topmargin, bottommargin, shifts))
-
-            elif "vertical" in pics or "||" in pics:
-                num_pics = len(pics_optionless)
-                pic_width = self.page_width / num_pics
-                for i in range(num_pics):
-                    if i == 0:
-                        left_margin_pic = self.leftmargin
-                    else:
-                        left_margin_pic = 0.0
-
-                    if i == num_pics - 1:
-                        right_margin_pic = self.rightmargin
-                    else:
-                        right_margin_pic = self.overlap
-
-                    f.write(self.get_pic(pics_optionless[i], [pic_width * (i + 0.5), self.page_height-pic_height/2.0], pic_width, pic_height, left_margin_pic, right_margin_pic, self.topmargin, bottommargin, shifts[i]))
-
-            elif "horizontal" in pics or "=" in pics:
-                num_pics = len(pics_optionless)
-                single_pic_height = pic_height / num_pics
-                for i in range(num_pics):
-                    if i == 0:
-                        top_margin_pic = self.topmargin
-                    else:
-                        top_margin_pic = 0.0
-
-                    if i == num_pics - 1:
-                        bottom_margin_pic = self.bottommargin
-                    else:
-                        bottom_margin_pic = self.overlap
-                    f.write(self.get_pic(pics_optionless[i], [self.page_width/2.0,self.page_height-single_pic_height * (i + 0.5)], self.page_width, single_pic_height, self.leftmargin, self.rightmargin, top_margin_pic, bottom_margin_pic, shifts[i]))
-
-            elif len(pics_optionless) == 4 and "||=" in pics:
-                width_h = 0.45 * self.page_width
-                width_v = (self.page_width - width_h) / 2
-                height_h = pic_height / 2
-                height_v = pic_height
-                # first vertical
-                f.write(self.get_pic(pics_optionless[0], [width_v / 2,self.page_height - 0.5 * pic_height], width_v, height_v, self.leftmargin, self.overlap, self.topmargin, self.bottommargin, shifts[0]))
-                # second vertical
-                f.write(self.get_pic(pics_optionless[1], [width_v * 3 / 2,self.page_height - 0.5 * pic_height], width_v, height_v, 0, self.overlap, self.topmargin, self.bottommargin, shifts[1]))
-                # first horizontal
-                f.write(self.get_pic(pics_optionless[2], [2*width_v + width_h/2,self.page_height - pic_height / 4], width_h, height_h, 0, self.rightmargin, self.topmargin, self.overlap, shifts[2]))
-                # second horizontal
-                f.write(self.get_pic(pics_optionless[3], [2*width_v + width_h/2,self.page_height - pic_height * 3.0 / 4.0], width_h, height_h, 0, self.rightmargin, 0, self.bottommargin, shifts[3]))
-         
-            ## Four pictures
-            elif len(pics) == 4:
-                # north west pic
-                f.write(self.get_pic(pics[0], [self.page_width/4.0,self.page_height-pic_height/4.0], self.page_width/2.0, pic_height/2.0, self.leftmargin, self.overlap, self.topmargin, self.overlap, shifts[0]))
-
-                # north east pic
-                f.write(self.get_pic(pics[1], [3.0*self.page_width/4.0,self.page_height-pic_height/4.0], self.page_width/2.0, pic_height/2.0, 0.0, self.rightmargin, self.topmargin, self.overlap, shifts[1]))
-
-                # south west pic
-                f.write(self.get_pic(pics[2], [self.page_width/4.0,self.page_height-3.0*pic_height/4.0], self.page_width/2.0, pic_height/2.0, self.leftmargin, self.overlap, 0.0, bottommargin, shifts[2]))
-
-                # south east pic
-                f.write(self.get_pic(pics[3], [3.0*self.page_width/4.0,self.page_height-3.0*pic_height/4.0], self.page_width/2.0, pic_height/2.0, 0.0, self.rightmargin, 0.0, bottommargin, shifts[3]))
-            else:
-                print("Currently only a single pic or a list of four pics can be put on one page")
-                exit(1)
+            f.write(self.get_pics(pics))
 
             if self.footer_over_pic:
                 f.write(r"\fill [footerbackgroundcolor, opacity=0.7] ({},{}) rectangle ({},{});".format(-self.leftmargin, -self.bottommargin, self.page_width+self.rightmargin, self.footerheight) + "\n")
@@ -631,18 +1200,82 @@ class CalendarCreator:
 
             f.write(self.get_footer())
 
-        with cd(self.texfolder):
-            subprocess.call(["lualatex",  filename],stdout=open(os.devnull, 'wb'))
-        return self.texfolder + os.sep + filename.replace(".tex",".pdf")
+        pdfname = self.texfolder + os.sep + filename.replace(".tex",".pdf")
+        if compile:
+            self.compile_pages([pdfname])
+        return pdfname
+
+
+    def create_week_page(self, year, days, pics, header=None, compile=True):
+        """Create latex text for a weekly planner page with pictures and the days of one week.
+
+        The files will be created inside "texfolder". The name is KWxx.tex where xx is
+        the calendar week.
+
+        Args:
+            year: Year of the planner
+            days: List with seven datetime.date objects from Monday to Sunday as returned
+               by get_weeks().
+            pics: Picture(s) to be placed on the page, the same layouts as for create_page()
+               are supported.
+            header: Latex header as returned by get_header(). If None, get_header() is called.
+               Passing the header avoids creating it again for each of the many planner pages.
+            compile: If False, only the latex file is written and lualatex is not called.
+
+        Returns: pdf filename of planner page.
+        """
+        filename = "KW{:02d}.tex".format(days[0].isocalendar()[1])
+        outfile = self.texfolder + os.sep + filename
+
+        if header is None:
+            header = self.get_header()
+
+        with open(outfile,"w") as f:
+            f.write(header)
+            f.write(self.get_pics(pics))
+
+            if self.footer_over_pic:
+                f.write(r"\fill [footerbackgroundcolor, opacity=0.7] ({},{}) rectangle ({},{});".format(-self.leftmargin, -self.bottommargin, self.page_width+self.rightmargin, self.footerheight) + "\n")
+
+            f.write(self.create_week_numbering(year, days, [0.7,0], "south west"))
+            f.write(self.get_weektext(days, [self.page_width-0.2,0], "south east"))
+
+            f.write(self.get_footer())
+
+        pdfname = self.texfolder + os.sep + filename.replace(".tex",".pdf")
+        if compile:
+            self.compile_pages([pdfname])
+        return pdfname
+
+    def get_titlepic_slot(self):
+        """Find the place of the title picture, see get_pic_slots().
+
+        Returns:
+            Tuple with the arguments of get_pic() for the title picture.
+        """
+        pic_height = self.page_height + self.topmargin + self.bottommargin
+        pic_width = self.page_width + self.leftmargin + self.rightmargin
+
+        center = []
+        center.append(self.page_width / 2.0)
+        #center.append(pageheight+margin - pic_height/2.0)
+        center.append(self.page_height / 2.0)
 
+        return (self.titlepic, center, pic_width, pic_height,
+                self.leftmargin, self.rightmargin, self.topmargin, 0,
+                self.get_shift(self.titlepic))
 
-    def create_titlepage(self, year):
+    def create_titlepage(self, year, compile=True):
         """Create latex text for the calendar title page with one picture.
 
         The latex file will be created inside "texfolder". The name is 00_titlepage.tex.
 
         At the end lualatex will be called on the created file.
 
+        Args:
+            year: Year of the calendar
+            compile: If False, only the latex file is written and lualatex is not called.
+
         Returns: pdf filename of titlepage
         """
         filename = "00_titlepage.tex"
@@ -656,14 +1289,6 @@ class CalendarCreator:
         #pic_height = pageheight/2.0
         #pic_width = pagewidth/2.0
 
-        pic_height = self.page_height + self.topmargin + self.bottommargin
-        pic_width = self.page_width + self.leftmargin + self.rightmargin
-
-        center = []
-        center.append(self.page_width / 2.0)
-        #center.append(pageheight+margin - pic_height/2.0)
-        center.append(self.page_height / 2.0)
-
         if self.title is None:
             tname = "Kalendar {}".format(year)
         else:
@@ -675,9 +1300,7 @@ class CalendarCreator:
         with open(outname, "w") as f:
             f.write(self.get_header())
             if self.titlepic is not None:
-                f.write(self.get_pic(self.titlepic, center, pic_width, pic_height,
-                                     self.leftmargin, self.rightmargin, self.topmargin, 0,
-                                     self.get_shift(self.titlepic)))
+                f.write(self.get_pic(*self.get_titlepic_slot()))
 
             f.write(r"\node at ({},{}) [anchor={},font=\scshape,color=title,scale=4,inner sep=0, outer sep=0,align=center, text opacity={}] {{{}}};".format(
                 self.titlepos[0], self.titlepos[1], self.titleanchor, self.titleopacity, tname) + "\n\n")
@@ -696,20 +1319,456 @@ class CalendarCreator:
 
             f.write(self.get_footer())
 
-        with cd(self.texfolder):
-            subprocess.call(["lualatex",  filename],stdout=open(os.devnull, 'wb'))
-        return self.texfolder + os.sep + filename.replace(".tex", ".pdf")
+        pdfname = self.texfolder + os.sep + filename.replace(".tex", ".pdf")
+        if compile:
+            self.compile_pages([pdfname])
+        return pdfname
+
+    def compile_tex(self, filename):
+        """Call lualatex on a latex file inside "texfolder".
+
+        lualatex runs in nonstopmode and stops at the first error, so it never waits
+        for input on the terminal. The peak memory of the lualatex process is stored
+        in "peak_memory".
+
+        Args:
+            filename: Name of the latex file (without the texfolder path)
+        Returns:
+            Return code of lualatex (0 on success)
+        """
+        env = None
+        if self.source_date_epoch is not None:
+            env = dict(os.environ, SOURCE_DATE_EPOCH=str(int(self.source_date_epoch)),
+                       FORCE_SOURCE_DATE="1")
+        proc = subprocess.Popen(["lualatex", "-interaction=nonstopmode", "-halt-on-error",
+                                 "-file-line-error", filename],
+                                cwd=self.texfolder, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not hasattr(os, "wait4"):
+            return proc.wait()
+
+        pid, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is given in kB on linux
+        self.peak_memory[filename] = rusage.ru_maxrss / 1024.0
+        return proc.returncode
+
+    def get_page_pixels(self, texname):
+        """Get the number of pixels of all pictures included on a page.
+
+        Args:
+            texname: Name of the latex file inside "texfolder"
+        Returns:
+            Number of pixels in millions
+        """
+        with open(self.texfolder + os.sep + texname) as f:
+            content = f.read()
+        pixels = 0
+        for picname in re.findall(r"\\includegraphics\[[^\]]*\]\{([^}]*)\}", content):
+            picname = os.path.join(self.texfolder, picname)
+            if os.path.exists(picname):
+                imsize, rotate = self.get_image_size_and_rotation(picname)
+                pixels += imsize[0] * imsize[1]
+        return pixels / 1e6
+
+    def load_memory_model(self):
+        """Get the model for the memory needed by lualatex.
+
+        The memory is estimated as base + per_mpixel * (pixels of the page in millions).
+        The two values are fitted to the peak memory of previous compiles stored in
+        "memory_stats_file".
+
+        Returns:
+            Dictionary with the keys "base", "per_mpixel" (both in MB, base is at least
+            "min_memory") and "samples" (list with [mpixels, peak memory] of previous
+            successful compiles)
+        """
+        model = {"base" : 150.0, "per_mpixel" : 30.0, "samples" : []}
+        if self.memory_stats_file is not None and os.path.exists(self.memory_stats_file):
+            with open(self.memory_stats_file) as f:
+                model["samples"] = json.load(f)["samples"]
+
+        samples = model["samples"]
+        if len(samples) >= 2:
+            n = len(samples)
+            mx = sum([smp[0] for smp in samples]) / n
+            my = sum([smp[1] for smp in samples]) / n
+            var = sum([(smp[0] - mx)**2 for smp in samples])
+            if var > 1e-6:
+                slope = sum([(smp[0] - mx) * (smp[1] - my) for smp in samples]) / var
+                model["per_mpixel"] = max(slope, 0.0)
+                model["base"] = my - model["per_mpixel"] * mx
+            else:
+                model["base"] = max([smp[1] for smp in samples]) - model["per_mpixel"] * mx
+        # a steep fit through few samples can give a negative base
+        model["base"] = max(model["base"], self.min_memory)
+        return model
+
+    def save_memory_model(self, model, max_samples=500):
+        """Store the samples of the memory model in "memory_stats_file"."""
+        if self.memory_stats_file is None:
+            return
+        with open(self.memory_stats_file, "w") as f:
+            json.dump({"samples" : model["samples"][-max_samples:]}, f)
+
+    def get_memory_budget(self):
+        """Get the memory in MB which can be used by all lualatex processes together.
+
+        Returns:
+            "memory_budget" if it is set, otherwise 80% of the available memory (or None if
+            this is unknown)
+        """
+        if self.memory_budget is not None:
+            return self.memory_budget
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return 0.8 * int(line.split()[1]) / 1024.0
+        except OSError:
+            pass
+        return None
+
+    def get_compile_errors(self, logname, context=2):
+        """Extract the error messages from a lualatex log file.
 
-    def join_pages(self, pages, filename):
+        Args:
+            logname: Filename of the .log file
+            context: Number of lines printed after each error line
+        Returns:
+            List with the relevant lines of the log file
+        """
+        if not os.path.exists(logname):
+            return ["no log file written: " + logname]
+
+        with open(logname, errors="replace") as f:
+            lines = f.read().splitlines()
+
+        errorline = re.compile(r"^(!|.*:\d+: )")
+        errors = []
+        skip_until = -1
+        for i, line in enumerate(lines):
+            if i <= skip_until:
+                continue
+            if errorline.match(line):
+                errors.extend(lines[i:i+context+1])
+                skip_until = i + context
+        if len(errors) == 0:
+            errors = lines[-context-1:]
+        return errors
+
+    def compile_pages(self, pages):
+        """Compile calendar pages, where the latex files are already written.
+
+        Up to "njobs" pages are compiled at the same time, where the memory each
+        lualatex process will need is estimated from the pixels of the pictures on the
+        page (see load_memory_model()). Pages are only started as long as the estimated
+        memory of all running pages fits into the memory budget (see get_memory_budget()),
+        heaviest pages first. The measured peak memory of each page is added to
+        "memory_stats_file" to improve the estimates of later runs.
+
+        If one page fails, the pages which did not start yet are cancelled, the errors
+        from the log file are printed and the program exits.
+
+        Args:
+            pages: List with pdf filenames as returned from create_page() or create_titlepage()
+        """
+        texnames = [os.path.basename(p).replace(".pdf", ".tex") for p in pages]
+        failed = None
+        error = None
+        cancelled = 0
+
+        model = self.load_memory_model()
+        budget = self.get_memory_budget()
+        mpixels = {tn : self.get_page_pixels(tn) for tn in texnames}
+        estimate = {tn : max(self.min_memory, model["base"] + model["per_mpixel"] * mpixels[tn])
+                    for tn in texnames}
+
+        pending = sorted(texnames, key=lambda tn: estimate[tn], reverse=True)
+        running = {}
+        used = 0.0
+        finished = queue.Queue()
+
+        def run(tn):
+            # always report back, otherwise the loop below would wait forever
+            try:
+                finished.put((tn, self.compile_tex(tn)))
+            except Exception as e:
+                finished.put((tn, e))
+
+        while len(pending) > 0 or len(running) > 0:
+            # start the heaviest pages which still fit into the budget
+            for tn in list(pending):
+                if len(running) >= max(1, self.njobs):
+                    break
+                if len(running) == 0 or budget is None or used + estimate[tn] <= budget:
+                    pending.remove(tn)
+                    running[tn] = estimate[tn]
+                    used += estimate[tn]
+                    threading.Thread(target=run, args=(tn,), daemon=True).start()
+
+            tn, ret = finished.get()
+            used -= running.pop(tn)
+            # failed or aborted compiles do not show the memory of a full page
+            if ret == 0 and tn in self.peak_memory:
+                model["samples"].append([mpixels[tn], self.peak_memory[tn]])
+            if ret != 0 and failed is None:
+                failed = tn
+                error = ret
+                cancelled = len(pending)
+                pending = []
+
+        self.save_memory_model(model)
+
+        if failed is not None:
+            logname = self.texfolder + os.sep + failed.replace(".tex", ".log")
+            print("Compiling {} failed:".format(failed))
+            if isinstance(error, Exception):
+                print("    {}: {}".format(type(error).__name__, error))
+            else:
+                for line in self.get_compile_errors(logname):
+                    print("    " + line)
+            if cancelled > 0:
+                print("Cancelled {} remaining pages".format(cancelled))
+            exit(1)
+
+    def join_pages(self, pages, filename, linearize=None):
         """Join calender pages to one big file.
 
         Args:
             pages: List with PDF filenames for pages which should be joined
             filename: Filename of joined calendar
+            linearize: If True, the file is written as linearized pdf, such that viewers
+               can show the first page before the whole file is downloaded and load other
+               pages with range requests (needs pikepdf). If None, "linearize" is used.
+        """
+        if linearize is None:
+            linearize = self.linearize
+
+        if self.source_date_epoch is not None:
+            self.join_pages_reproducible(pages, filename)
+        else:
+            subprocess.call([self.merge_tool] + pages + [filename])
+
+        if linearize:
+            self.linearize_pdf(filename)
+
+    def linearize_pdf(self, filename):
+        """Rewrite a pdf file as linearized pdf.
+
+        Args:
+            filename: pdf file, which is replaced by the linearized version
+        """
+        pikepdf = self.import_pikepdf()
+        tmpname = filename + ".linearized"
+        with pikepdf.open(filename) as pdf:
+            pdf.save(tmpname, linearize=True,
+                     deterministic_id=self.source_date_epoch is not None)
+        os.replace(tmpname, filename)
+        print("Linearized " + filename)
+
+    def join_pages_reproducible(self, pages, filename):
+        """Join calendar pages such that the same pages always give the same file.
+
+        The pages are copied in the given order with pikepdf and the document ID is
+        computed from the content instead of the current time.
+
+        Args:
+            pages: List with PDF filenames for pages which should be joined
+            filename: Filename of joined calendar
+        """
+        pikepdf = self.import_pikepdf()
+        sources = [pikepdf.open(p) for p in pages]
+        try:
+            with pikepdf.new() as pdf:
+                for src in sources:
+                    pdf.pages.extend(src.pages)
+                pdf.save(filename, deterministic_id=True)
+        finally:
+            for src in sources:
+                src.close()
+
+    def import_pikepdf(self):
+        """Import pikepdf, which is only needed for some features."""
+        try:
+            import pikepdf
+        except ImportError:
+            print("This feature needs the pikepdf package")
+            exit(1)
+        return pikepdf
+
+    def set_output_profiles(self, profiles):
+        """Set additional outputs with lower picture resolution (e.g. a light PDF for screens).
+
+        The profiles are derived from the compiled calendar by resizing the embedded
+        pictures, so no latex compile is done for them. This needs the pikepdf package.
+
+        Args:
+            profiles: Dictionary with the output filename as key and a dictionary with the
+               following keys as value:
+               - dpi: Maximum resolution of the pictures relative to their size on the page
+               - quality [optional]: JPEG quality of the resized pictures (default: 80)
+        """
+        self.output_profiles = profiles
+
+    def get_picture_scales(self, pics, dpi):
+        """Get the scaling of each picture which is needed for a given resolution.
+
+        Args:
+            pics: Pictures as given to create_calendar()
+            dpi: Target resolution
+        Returns:
+            Dictionary with the sha256 hash of each included picture file as key and the
+            factor for width and height (<= 1) as value.
+        """
+        scales = {}
+        for page in self.get_placements(pics):
+            for picname, width, height in page:
+                # the factor is applied to the embedded picture, which may be a resized copy
+                included = self.image_map.get(picname, picname)
+                imsize, rotate = self.get_image_size_and_rotation(included)
+                scale = min(1.0, dpi * width / 2.54 / imsize[0])
+                if self.picture_store is not None and not self.is_generated_picture(included):
+                    filehash = self.picture_store.get_hash(included)
+                else:
+                    with open(included, "rb") as f:
+                        filehash = hashlib.sha256(f.read()).hexdigest()
+                scales[filehash] = max(scale, scales.get(filehash, 0.0))
+        return scales
+
+    def derive_profile(self, src, dst, scales, quality=80):
+        """Write a copy of a PDF with resized pictures.
+
+        Embedded JPEG pictures are identified by the hash of their data (lualatex embeds
+        the JPEG files unchanged) and resized by the factor given in "scales". Pictures
+        keep their orientation, such that the page content does not change.
+
+        Args:
+            src: Compiled PDF file
+            dst: Output filename
+            scales: Dictionary as returned by get_picture_scales()
+            quality: JPEG quality of the resized pictures
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from PIL import Image
+        pikepdf = self.import_pikepdf()
+
+        def resize(raw):
+            im = Image.open(io.BytesIO(raw))
+            if im.mode not in ("RGB", "L"):
+                return None
+            scale = scales[hashlib.sha256(raw).hexdigest()]
+            imsize = (max(1, round(scale * im.size[0])), max(1, round(scale * im.size[1])))
+            im.draft(im.mode, imsize)
+            if im.size[0] > imsize[0]:
+                im = im.resize(imsize, Image.LANCZOS)
+            out = io.BytesIO()
+            im.save(out, "JPEG", quality=quality, optimize=True)
+            if len(out.getvalue()) >= len(raw):
+                return None
+            return out.getvalue(), im.size
+
+        with pikepdf.open(src) as pdf:
+            images = []
+            for obj in pdf.objects:
+                if (isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == "/Image"
+                        and obj.get("/Filter") == "/DCTDecode"):
+                    raw = obj.read_raw_bytes()
+                    if hashlib.sha256(raw).hexdigest() in scales:
+                        images.append((obj, raw))
+
+            with ThreadPoolExecutor(max_workers=max(1, self.njobs)) as pool:
+                resized = list(pool.map(lambda img: resize(img[1]), images))
+
+            for (obj, raw), res in zip(images, resized):
+                if res is None:
+                    continue
+                obj.write(res[0], filter=pikepdf.Name.DCTDecode)
+                obj.Width = res[1][0]
+                obj.Height = res[1][1]
+            pdf.save(dst, deterministic_id=self.source_date_epoch is not None)
+
+    def create_profiles(self, pics):
+        """Create all output profiles (see set_output_profiles()) from "calendar_filename".
+
+        Args:
+            pics: Pictures as given to create_calendar()
+        """
+        for filename, profile in self.output_profiles.items():
+            start = time.perf_counter()
+            scales = self.get_picture_scales(pics, profile["dpi"])
+            self.derive_profile(self.calendar_filename, filename, scales, profile.get("quality", 80))
+            print("Created {} ({} dpi, {:.2f} MB) in {:.1f} s".format(
+                filename, profile["dpi"], os.path.getsize(filename) / 1e6, time.perf_counter() - start))
+
+    def find_font(self, font):
+        """Check if luaotfload can find a font in its font database."""
+        ret = subprocess.call(["luaotfload-tool", "--find=" + font],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return ret == 0
+
+    def preflight(self):
+        """Check the toolchain and warm up the font cache before any page is built.
+
+        Verifies that lualatex, luaotfload-tool and the merge tool (or pikepdf for
+        reproducible output) are available and that the fonts used in get_header() can be
+        found. The font database of luaotfload is only rebuilt if a font is not found, so
+        nodes with a warm cache skip the rescan. Then a minimal document using the calendar
+        preamble is compiled once, so that the font cache is filled before any page compile
+        runs (in particular before several compiles run at the same time). The check is only
+        done once per CalendarCreator instance.
+
+        Exits with an error message if the toolchain is incomplete.
         """
-        subprocess.call(["pdfunite"] + pages + [filename])
+        if self._preflight_done:
+            return
+
+        tools = ["lualatex", "luaotfload-tool"]
+        if self.source_date_epoch is None:
+            tools.append(self.merge_tool)
+        else:
+            # reproducible pages are joined with pikepdf instead of the merge tool
+            self.import_pikepdf()
+        for tool in tools:
+            if shutil.which(tool) is None:
+                print("Preflight: required program not found: " + tool)
+                exit(1)
+
+        start = time.perf_counter()
+
+        fonts = [self.font, self.font + " Bold"]
+        missing = [font for font in fonts if not self.find_font(font)]
+        if len(missing) > 0:
+            # update the font database, this is the expensive part on a fresh node
+            ret = subprocess.call(["luaotfload-tool", "--update"],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if ret != 0:
+                print("Preflight: luaotfload-tool --update failed with return code {}".format(ret))
+                exit(1)
+            for font in missing:
+                if not self.find_font(font):
+                    print("Preflight: font not found: " + font)
+                    exit(1)
+
+        if not os.path.exists(self.texfolder):
+            os.mkdir(self.texfolder)
 
-    def create_calendar(self, pics, year_start, month_start):
+        # compile the calendar preamble once to fill the font cache
+        filename = "00_preflight.tex"
+        with open(self.texfolder + os.sep + filename, "w") as f:
+            f.write(self.get_header())
+            f.write(r"  \node {Mo Di 1 2 3 \bfseries Januar 2023};" + "\n")
+            f.write(self.get_footer())
+        if self.compile_tex(filename) != 0:
+            print("Preflight: compiling the calendar preamble failed, see {}".format(
+                self.texfolder + os.sep + filename.replace(".tex", ".log")))
+            exit(1)
+
+        print("Preflight: toolchain ok, font cache warm-up took {:.1f} s".format(
+            time.perf_counter() - start))
+        self._preflight_done = True
+
+    def create_calendar(self, pics, year_start, month_start, max_size=None, max_page_size=None):
         """Main function which will create a whole calendar.
 
         Args:
@@ -720,35 +1779,111 @@ class CalendarCreator:
                  (or any other number for more or less months)
             year_start: Year of first month in calender
             month_start: Index of first month (1 -> January, 2 -> February, ...)
+            max_size: If given, the pictures are resized and compressed such that the
+               calendar file is at most this size in MB (see fit_images()).
+            max_page_size: If given, each page is at most this size in MB.
         """
-        filenames = []
+        with self.build_folder():
+            filenames = []
 
-        if not os.path.exists(self.texfolder):
-            os.mkdir(self.texfolder)
+            if not os.path.exists(self.texfolder):
+                os.mkdir(self.texfolder)
 
-        fn = self.create_titlepage(year_start)
-        filenames.append(fn)
-
-        num_months = len(pics)
-        year = year_start
-        imonth = month_start
-        #for i, month in enumerate(self.months):
-        for i in range(num_months):
-            while imonth > 12:
-                imonth = imonth - 12
-                year = year + 1
-            month = self.months[imonth-1]
-            print("Generating " + month)
-            if pics is None:
-                monthpics = None
-            else:
-                monthpics = pics[i]
-            fn = self.create_page(year, month, monthpics)
+            self.preflight()
+
+            if self.picture_store is not None:
+                self.check_pictures(pics)
+
+            # resized pictures of an earlier calendar must not be included again
+            self.image_map = {}
+            if max_size is not None or max_page_size is not None:
+                self.fit_images(pics, max_size, max_page_size)
+
+            fn = self.create_titlepage(year_start, compile=False)
+            filenames.append(fn)
+
+            num_months = len(pics)
+            year = year_start
+            imonth = month_start
+            #for i, month in enumerate(self.months):
+            for i in range(num_months):
+                while imonth > 12:
+                    imonth = imonth - 12
+                    year = year + 1
+                month = self.months[imonth-1]
+                print("Generating " + month)
+                if pics is None:
+                    monthpics = None
+                else:
+                    monthpics = pics[i]
+                fn = self.create_page(year, month, monthpics, compile=False)
+                filenames.append(fn)
+
+                imonth = imonth + 1
+
+            print("Compiling {} pages".format(len(filenames)))
+            self.compile_pages(filenames)
+            print("Merging files to " + self.calendar_filename)
+            self.join_pages(filenames, self.calendar_filename)
+
+            if max_size is not None:
+                size = os.path.getsize(self.calendar_filename) / 1e6
+                print("Calendar size: {:.2f} MB (budget {:.2f} MB)".format(size, max_size))
+            elif max_page_size is not None:
+                size = os.path.getsize(self.calendar_filename) / 1e6
+                print("Calendar size: {:.2f} MB ({:.2f} MB per page, budget {:.2f} MB)".format(
+                    size, size / len(filenames), max_page_size))
+
+            self.create_profiles(pics)
+
+    def create_weekly_planner(self, pics, year):
+        """Create a weekly planner with a title page and one page per calendar week.
+
+        The days of all weeks are computed once for the whole year and all pages share
+        the same latex header. The pages are first written and then compiled together
+        with compile_pages(), so "njobs" pages are compiled at the same time.
+
+        Args:
+            pics: List with pictures for each week. Each entry can be anything which can be
+               passed to create_page() (one picture, a list of pictures with layout option
+               or None). If the list has less entries than there are weeks, the pictures
+               are repeated from the beginning.
+            year: Year of the planner
+        """
+        with self.build_folder():
+            filenames = []
+
+            if not os.path.exists(self.texfolder):
+                os.mkdir(self.texfolder)
+
+            self.preflight()
+
+            if self.picture_store is not None and pics is not None:
+                self.check_pictures(pics)
+
+            self.image_map = {}
+            weeks = self.get_weeks(year)
+            header = self.get_header()
+
+            fn = self.create_titlepage(year, compile=False)
             filenames.append(fn)
 
-            imonth = imonth + 1
-        print("Merging files to " + self.calendar_filename)
-        self.join_pages(filenames, self.calendar_filename)
+            for i, days in enumerate(weeks):
+                if pics is None or len(pics) == 0:
+                    weekpics = None
+                else:
+                    weekpics = pics[i % len(pics)]
+                fn = self.create_week_page(year, days, weekpics, header=header, compile=False)
+                filenames.append(fn)
+
+            print("Compiling {} pages".format(len(filenames)))
+            self.compile_pages(filenames)
+
+            print("Merging files to " + self.calendar_filename)
+            self.join_pages(filenames, self.calendar_filename)
+
+            if pics is not None:
+                self.create_profiles(pics)
 
     def get_shift(self, picname):
         """Get shifts of one picture or a picture list
@@ -768,14 +1903,15 @@ class CalendarCreator:
             for pn in picname:
                 if pn in self.picoptions:
                     pass
-                elif pn in self.shiftdict:
-                    shft.append(float(self.shiftdict[pn]))
                 else:
-                    shft.append(float(0))
+                    shft.append(self.get_shift(pn))
             return shft
         else :
             if picname in self.shiftdict:
                 return float(self.shiftdict[picname])
+            elif len(self._shift_by_hash) > 0 and os.path.exists(picname):
+                # identical picture stored under another path (see check_pictures())
+                return float(self._shift_by_hash.get(self.picture_store.get_hash(picname), 0))
             else:
                 return float(0)
 
@@ -0,0 +1,415 @@
+#!/usr/bin/python3
+
+import os
+import csv
+import bisect
+import json
+import hashlib
+import calendar
+import datetime
+from collections import namedtuple
+
+Event = namedtuple("Event", ["date", "name", "category"])
+
+# Version of the parsed format stored in the cache, increase when parse_ical(),
+# parse_csv() or the rule dictionaries change.
+CACHE_VERSION = 2
+
+FREQUENCIES = ["yearly", "monthly", "weekly", "daily"]
+WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+# parts of RRULE which are understood by expand()
+RRULE_PARTS = ["FREQ", "INTERVAL", "COUNT", "UNTIL", "BYMONTH", "BYMONTHDAY", "BYDAY", "WKST"]
+
+class EventCalendar:
+    """Date indexed collection of holidays, birthdays and other events.
+
+    Events are read from iCalendar (.ics) or CSV files. Each file is parsed only once,
+    the parsed events are cached in memory and on disk (as JSON), where the cache is
+    keyed by the hash of the file content and the cache format version. Recurring events
+    are expanded for the years given to the constructor and all events are kept sorted by
+    date, such that the events of one month can be found by a range query with get_range().
+    """
+
+    def __init__(self, year_start, year_end, cachefolder=".eventcache"):
+        """Create an empty event calendar.
+
+        Args:
+            year_start: First year for which recurring events are expanded.
+            year_end: Last year (inclusive) for which recurring events are expanded.
+            cachefolder: Folder where the parsed event files are stored. If None, parsed
+               files are only cached in memory.
+        """
+        self.year_start = year_start
+        self.year_end = year_end
+        self.cachefolder = cachefolder
+
+        self._parsed = {} # file hash -> list of (first date, name, category, rule)
+        self._dates = []
+        self._events = []
+
+    def load(self, filename, category=None):
+        """Load events from an iCalendar or CSV file.
+
+        Args:
+            filename: Name of an .ics or .csv file.
+               CSV files need a header line with the columns "date" (YYYY-MM-DD) and "name"
+               and can have the optional columns "category" and "repeat" ("yearly",
+               "monthly", "weekly" or "daily"). Other repeat values are an error.
+            category: Category of all events in this file (e.g. "holiday", "birthday").
+               If None, the category is taken from the file (CATEGORIES of iCalendar events,
+               category column of CSV files) and falls back to "event".
+        """
+        with open(filename, "rb") as f:
+            content = f.read()
+        filehash = hashlib.sha256(content).hexdigest()
+
+        if filehash not in self._parsed:
+            self._parsed[filehash] = self._load_cached(filehash)
+        if self._parsed[filehash] is None:
+            if filename.lower().endswith(".ics"):
+                parsed = self.parse_ical(content.decode("utf-8", errors="replace"))
+            elif filename.lower().endswith(".csv"):
+                parsed = self.parse_csv(content.decode("utf-8", errors="replace"))
+            else:
+                print("Unknown event file type: " + filename)
+                exit(1)
+            self._parsed[filehash] = parsed
+            self._store_cached(filehash, parsed)
+
+        events = []
+        for first, name, cat, rule in self._parsed[filehash]:
+            if category is not None:
+                cat = category
+            for d in self.expand(first, rule):
+                events.append(Event(d, name, cat))
+        self._add(events)
+
+    def get_range(self, first, last):
+        """Find all events between two dates.
+
+        Args:
+            first: First date (datetime.date) of the range
+            last: Last date (datetime.date, inclusive) of the range
+        Returns:
+            Dictionary with the dates as keys and lists of events on that date as values.
+        """
+        lo = bisect.bisect_left(self._dates, first)
+        hi = bisect.bisect_right(self._dates, last)
+        found = {}
+        for ev in self._events[lo:hi]:
+            found.setdefault(ev.date, []).append(ev)
+        return found
+
+    def expand(self, first, rule):
+        """Get all dates of a (possibly recurring) event within the years of the calendar.
+
+        Args:
+            first: Date of the first occurence
+            rule: None for single events, otherwise a dictionary with the keys
+               "freq" ("yearly", "monthly", "weekly", "daily"), "interval" (>= 1),
+               "count" (or None), "until" (datetime.date or None), "bymonth" (list of
+               months or None), "bymonthday" (list of days, negative values count from
+               the end of the month, or None), "byday" (list of [n, weekday] with weekday
+               0 for monday and n the n-th such weekday in the month or year, 0 for all,
+               or None), "exdate" (list of excluded datetime.date) and "days" (number of
+               days of each occurence).
+               The BY parts work as in RFC 5545 (without BYSETPOS, BYWEEKNO, BYYEARDAY).
+        Returns:
+            List with the dates of all occurences between year_start and year_end.
+        """
+        range_start = datetime.date(self.year_start, 1, 1)
+        range_end = datetime.date(self.year_end, 12, 31)
+        if rule is None:
+            if range_start <= first <= range_end:
+                return [first]
+            return []
+
+        if rule["freq"] not in FREQUENCIES or rule["interval"] < 1:
+            raise ValueError("Invalid recurrence rule: {}".format(rule))
+
+        until = range_end
+        if rule["until"] is not None:
+            until = min(until, rule["until"])
+        exdate = set(rule.get("exdate") or [])
+
+        dates = []
+        n = 0
+        period = 0
+        while rule["count"] is None or n < rule["count"]:
+            candidates, period_start = self._period_dates(first, rule, period)
+            if period_start > until:
+                break
+            period += 1
+            for d in candidates:
+                if d < first:
+                    continue
+                if d > until or (rule["count"] is not None and n >= rule["count"]):
+                    break
+                n += 1
+                if d in exdate:
+                    continue
+                for i in range(rule.get("days", 1)):
+                    day = d + datetime.timedelta(days=i)
+                    if range_start <= day <= range_end:
+                        dates.append(day)
+        return dates
+
+    def parse_ical(self, text):
+        """Parse the events of an iCalendar file.
+
+        Only the date of DTSTART is used. All-day events spanning several days
+        (DTEND with VALUE=DATE) are marked on each of these days. Of RRULE, FREQ,
+        INTERVAL, COUNT, UNTIL, BYMONTH, BYMONTHDAY and BYDAY are supported, EXDATE
+        removes single occurences. Events with other RRULE parts (e.g. BYSETPOS) or
+        invalid rules are skipped with a warning.
+
+        Args:
+            text: Content of the iCalendar file
+        Returns:
+            List with (first date, name, category, rule) for each event, see expand()
+            for the rule.
+        """
+        # unfold lines which are continued with a leading space
+        lines = []
+        for line in text.splitlines():
+            if line[:1] in (" ", "\t") and len(lines) > 0:
+                lines[-1] += line[1:]
+            else:
+                lines.append(line)
+
+        parsed = []
+        event = None
+        for line in lines:
+            if line == "BEGIN:VEVENT":
+                event = {}
+            elif line == "END:VEVENT" and event is not None:
+                if "DTSTART" in event:
+                    parsed.extend(self._ical_event(event))
+                event = None
+            elif event is not None and ":" in line:
+                key, value = line.split(":", 1)
+                key = key.split(";", 1)[0].upper()
+                if key == "EXDATE":
+                    # can be given several times, each with a list of dates
+                    event.setdefault(key, []).extend(value.split(","))
+                else:
+                    event[key] = (line.split(":", 1)[0], value)
+        return parsed
+
+    def parse_csv(self, text):
+        """Parse the events of a CSV file, see load() for the columns.
+
+        Args:
+            text: Content of the CSV file
+        Returns:
+            List with (first date, name, category, rule) for each event, see expand()
+            for the rule.
+        """
+        parsed = []
+        for row in csv.DictReader(text.splitlines()):
+            first = datetime.date.fromisoformat(row["date"].strip())
+            repeat = (row.get("repeat") or "").strip().lower()
+            rule = None
+            if len(repeat) > 0:
+                if repeat not in FREQUENCIES:
+                    print("Unknown repeat value in event file: {} (use one of {})".format(
+                        repeat, ", ".join(FREQUENCIES)))
+                    exit(1)
+                rule = self._make_rule(repeat)
+            cat = (row.get("category") or "").strip() or "event"
+            parsed.append((first, row["name"].strip(), cat, rule))
+        return parsed
+
+    def _ical_event(self, event):
+        first = self._ical_date(event["DTSTART"][1])
+        name = event.get("SUMMARY", ("", ""))[1].replace("\\,", ",").replace("\\;", ";")
+        cat = "event"
+        if "CATEGORIES" in event:
+            cat = event["CATEGORIES"][1].split(",")[0].strip().lower() or "event"
+
+        ndays = 1
+        if "DTEND" in event and "VALUE=DATE" in event["DTEND"][0].upper():
+            ndays = max(1, (self._ical_date(event["DTEND"][1]) - first).days)
+
+        if "RRULE" not in event:
+            return [(first + datetime.timedelta(days=i), name, cat, None) for i in range(ndays)]
+
+        parts = dict([p.split("=", 1) for p in event["RRULE"][1].upper().split(";") if "=" in p])
+        unsupported = [p for p in parts if p not in RRULE_PARTS]
+        if parts.get("WKST", "MO") != "MO":
+            unsupported.append("WKST=" + parts["WKST"])
+        if len(unsupported) > 0:
+            print("Skipping event {} ({}): unsupported RRULE part {}".format(
+                name, first, ", ".join(unsupported)))
+            return []
+        try:
+            rule = self._make_rule(
+                parts.get("FREQ", "YEARLY").lower(),
+                interval=int(parts.get("INTERVAL", 1)),
+                count=int(parts["COUNT"]) if "COUNT" in parts else None,
+                until=self._ical_date(parts["UNTIL"]) if "UNTIL" in parts else None,
+                bymonth=[int(m) for m in parts["BYMONTH"].split(",")] if "BYMONTH" in parts else None,
+                bymonthday=[int(d) for d in parts["BYMONTHDAY"].split(",")] if "BYMONTHDAY" in parts else None,
+                byday=[self._ical_weekday(d) for d in parts["BYDAY"].split(",")] if "BYDAY" in parts else None,
+                exdate=[self._ical_date(d) for d in event.get("EXDATE", [])],
+                days=ndays)
+        except ValueError as e:
+            print("Skipping event {} ({}): {}".format(name, first, e))
+            return []
+        return [(first, name, cat, rule)]
+
+    def _make_rule(self, freq, interval=1, count=None, until=None, bymonth=None,
+                   bymonthday=None, byday=None, exdate=None, days=1):
+        # rule dictionary as described in expand(), raises ValueError for invalid rules
+        if freq not in FREQUENCIES:
+            raise ValueError("unknown FREQ " + freq)
+        if interval < 1:
+            raise ValueError("INTERVAL must be at least 1")
+        if count is not None and count < 0:
+            raise ValueError("COUNT must not be negative")
+        if bymonth is not None and not all([1 <= m <= 12 for m in bymonth]):
+            raise ValueError("invalid BYMONTH")
+        if bymonthday is not None and not all([1 <= abs(d) <= 31 for d in bymonthday]):
+            raise ValueError("invalid BYMONTHDAY")
+        return {"freq" : freq, "interval" : interval, "count" : count, "until" : until,
+                "bymonth" : bymonth, "bymonthday" : bymonthday, "byday" : byday,
+                "exdate" : exdate or [], "days" : days}
+
+    def _ical_weekday(self, value):
+        # "2SU" -> [2, 6], "-1MO" -> [-1, 0], "FR" -> [0, 4]
+        value = value.strip()
+        if value[-2:] not in WEEKDAYS:
+            raise ValueError("invalid BYDAY " + value)
+        nth = int(value[:-2]) if len(value) > 2 else 0
+        return [nth, WEEKDAYS.index(value[-2:])]
+
+    def _ical_date(self, value):
+        value = value.strip()
+        return datetime.date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+    def _period_dates(self, first, rule, period):
+        # candidate dates (sorted) of one period (year, month, week or day) of a rule and
+        # the first day of that period
+        freq = rule["freq"]
+        interval = rule["interval"]
+        bymonth = rule.get("bymonth")
+        bymonthday = rule.get("bymonthday")
+        byday = rule.get("byday")
+
+        if freq == "yearly":
+            year = first.year + interval * period
+            period_start = datetime.date(year, 1, 1)
+            if byday is not None and bymonth is None and bymonthday is None:
+                # n-th weekday of the year
+                days = [period_start + datetime.timedelta(days=i)
+                        for i in range(366 if calendar.isleap(year) else 365)]
+                return self._filter_byday(days, byday), period_start
+            months = bymonth
+            if months is None:
+                months = list(range(1, 13)) if bymonthday is not None else [first.month]
+            candidates = []
+            for month in sorted(months):
+                candidates.extend(self._month_dates(first, year, month, bymonthday, byday))
+            return candidates, period_start
+        elif freq == "monthly":
+            month = first.month - 1 + interval * period
+            year = first.year + month // 12
+            month = month % 12 + 1
+            period_start = datetime.date(year, month, 1)
+            if bymonth is not None and month not in bymonth:
+                return [], period_start
+            return self._month_dates(first, year, month, bymonthday, byday), period_start
+        elif freq == "weekly":
+            # weeks start on monday (WKST=MO)
+            period_start = first - datetime.timedelta(days=first.weekday()) \
+                + datetime.timedelta(days=7 * interval * period)
+            weekdays = [first.weekday()] if byday is None else [wd for nth, wd in byday]
+            days = [period_start + datetime.timedelta(days=wd) for wd in sorted(set(weekdays))]
+        else:
+            period_start = first + datetime.timedelta(days=interval * period)
+            days = [period_start]
+            if byday is not None:
+                days = [d for d in days if d.weekday() in [wd for nth, wd in byday]]
+            if bymonthday is not None:
+                days = [d for d in days if self._is_monthday(d, bymonthday)]
+
+        if bymonth is not None:
+            days = [d for d in days if d.month in bymonth]
+        return days, period_start
+
+    def _month_dates(self, first, year, month, bymonthday, byday):
+        # dates of one month matching BYMONTHDAY and BYDAY (day of "first" if neither is given)
+        ndays = calendar.monthrange(year, month)[1]
+        if bymonthday is None and byday is None:
+            if first.day > ndays:
+                # e.g. 31st in a month with 30 days or 29th of February, skip as in RFC 5545
+                return []
+            return [datetime.date(year, month, first.day)]
+        days = [datetime.date(year, month, d) for d in range(1, ndays + 1)]
+        if bymonthday is not None:
+            days = [d for d in days if self._is_monthday(d, bymonthday)]
+        if byday is not None:
+            days = self._filter_byday(days, byday, [datetime.date(year, month, d) for d in range(1, ndays + 1)])
+        return days
+
+    def _is_monthday(self, date, bymonthday):
+        ndays = calendar.monthrange(date.year, date.month)[1]
+        return date.day in bymonthday or date.day - ndays - 1 in bymonthday
+
+    def _filter_byday(self, days, byday, allday=None):
+        # keep the days matching one of the [n, weekday] entries, where n counts within
+        # "allday" (all days of the month or year)
+        if allday is None:
+            allday = days
+        selected = set()
+        for nth, wd in byday:
+            matching = [d for d in allday if d.weekday() == wd]
+            if nth == 0:
+                selected.update(matching)
+            elif nth > 0 and nth <= len(matching):
+                selected.add(matching[nth - 1])
+            elif nth < 0 and -nth <= len(matching):
+                selected.add(matching[nth])
+        return [d for d in days if d in selected]
+
+    def _add(self, events):
+        # insert the new events, keeping everything sorted by date
+        merged = sorted(list(zip(self._dates, self._events)) + [(ev.date, ev) for ev in events],
+                        key=lambda e: e[0])
+        self._dates = [m[0] for m in merged]
+        self._events = [m[1] for m in merged]
+
+    def _cachename(self, filehash):
+        return self.cachefolder + os.sep + "v{}_{}.json".format(CACHE_VERSION, filehash)
+
+    def _load_cached(self, filehash):
+        if self.cachefolder is None or not os.path.exists(self._cachename(filehash)):
+            return None
+        with open(self._cachename(filehash)) as f:
+            stored = json.load(f)
+        parsed = []
+        for first, name, cat, rule in stored:
+            if rule is not None:
+                if rule["until"] is not None:
+                    rule["until"] = datetime.date.fromisoformat(rule["until"])
+                rule["exdate"] = [datetime.date.fromisoformat(d) for d in rule["exdate"]]
+            parsed.append((datetime.date.fromisoformat(first), name, cat, rule))
+        return parsed
+
+    def _store_cached(self, filehash, parsed):
+        if self.cachefolder is None:
+            return
+        if not os.path.exists(self.cachefolder):
+            os.mkdir(self.cachefolder)
+        stored = []
+        for first, name, cat, rule in parsed:
+            if rule is not None:
+                rule = dict(rule)
+                if rule["until"] is not None:
+                    rule["until"] = rule["until"].isoformat()
+                rule["exdate"] = [d.isoformat() for d in rule["exdate"]]
+            stored.append([first.isoformat(), name, cat, rule])
+        tmpname = self._cachename(filehash) + ".tmp"
+        with open(tmpname, "w") as f:
+            json.dump(stored, f)
+        os.replace(tmpname, self._cachename(filehash))
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+
+import math
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+class LayoutOptimizer:
+    """Assign photos to months and picture layouts with as little cropping as possible.
+
+    Each layout of create_page() is described by its slots, i.e. the clip regions of
+    get_pic(). When a photo is placed in a slot, the part of the photo outside of the
+    slot is cropped away, which is a fraction of 1 - min(a_photo/a_slot, a_slot/a_photo)
+    for the aspect ratios a. The optimizer chooses how many months use which layout and
+    then solves the assignment of photos to all slots of the calendar as a linear sum
+    assignment problem on a cost matrix with the cropped area of each photo in each slot.
+    """
+
+    def __init__(self, calcreator, layouts=None):
+        """Create optimizer.
+
+        Args:
+            calcreator: CalendarCreator, whose page geometry and picture sizes are used.
+            layouts: List of layouts which can be used. Each layout is given as it would be
+               passed to create_page(), with arbitrary placeholder names instead of
+               pictures, e.g. ["a", "b", "vertical"]. If None, a single picture,
+               two "vertical" and two "horizontal" pictures, "||=" and four pictures are used.
+        """
+        self.calcreator = calcreator
+        if layouts is None:
+            layouts = ["a",
+                       ["a", "b", "vertical"],
+                       ["a", "b", "horizontal"],
+                       ["a", "b", "c", "d", "||="],
+                       ["a", "b", "c", "d"]]
+        self.layouts = layouts
+        self.penalty = 1.0 # cost for each photo more or less than requested
+        self.max_sweeps = 10
+        self.vertical_crop_shift = -1.0 / 3.0 # default shift of photos cut at top and bottom
+
+        # aspect ratio and area of each slot of each layout
+        self.slot_aspects = []
+        self.slot_areas = []
+        for layout in self.layouts:
+            aspects = []
+            areas = []
+            for slot in self.calcreator.get_pic_slots(layout):
+                width = slot[2] + slot[4] + slot[5]
+                height = slot[3] + slot[6] + slot[7]
+                aspects.append(width / height)
+                areas.append(width * height)
+            self.slot_aspects.append(np.array(aspects))
+            self.slot_areas.append(np.array(areas))
+        self.num_slots = np.array([len(a) for a in self.slot_aspects])
+
+    def get_aspects(self, photos):
+        """Get the aspect ratios (width / height, as shown on the page) of the photos."""
+        store = self.calcreator.picture_store
+        if store is not None:
+            # hash and probe all new photos in parallel
+            store.update(photos)
+        aspects = np.empty(len(photos))
+        for i, photo in enumerate(photos):
+            imsize, rotate = self.calcreator.get_image_size_and_rotation(photo)
+            aspects[i] = imsize[0] / float(imsize[1])
+        return aspects
+
+    def crop_costs(self, photo_aspects, slot_aspects, slot_areas):
+        """Cropped area in cm^2 for each photo in each slot.
+
+        Returns:
+            Matrix with one row per photo and one column per slot.
+        """
+        ratio = photo_aspects[:, None] / slot_aspects[None, :]
+        return slot_areas[None, :] * (1.0 - np.minimum(ratio, 1.0 / ratio))
+
+    def assign(self, costs, counts):
+        """Assign photos to the slots of all months for a given number of months per layout.
+
+        Args:
+            costs: List with crop cost matrix for each layout, see crop_costs().
+            counts: Number of months for each layout
+        Returns:
+            Tuple with total cost, photo indices and (layout, slot) of each assigned slot.
+        """
+        columns = []
+        slots = []
+        for li, count in enumerate(counts):
+            for c in range(count):
+                for si in range(self.num_slots[li]):
+                    columns.append(costs[li][:, si])
+                    slots.append((li, si))
+        if len(columns) == 0:
+            return 0.0, np.array([], dtype=int), []
+        matrix = np.stack(columns, axis=1)
+        if matrix.shape[1] > matrix.shape[0]:
+            return math.inf, None, slots
+
+        # Only the len(slots) cheapest photos of each slot can be part of an optimal
+        # solution, all other photos are removed before solving the assignment.
+        k = matrix.shape[1]
+        if matrix.shape[0] > k:
+            candidates = np.unique(np.argpartition(matrix, k - 1, axis=0)[:k, :])
+        else:
+            candidates = np.arange(matrix.shape[0])
+        rows, cols = linear_sum_assignment(matrix[candidates, :])
+        photo_idx = np.empty(k, dtype=int)
+        photo_idx[cols] = candidates[rows]
+        return matrix[candidates[rows], cols].sum(), photo_idx, slots
+
+    def objective(self, costs, counts, target):
+        total, photo_idx, slots = self.assign(costs, counts)
+        area = sum([counts[li] * self.slot_areas[li].sum() for li in range(len(counts))])
+        nphotos = int((self.num_slots * counts).sum())
+        return total / area + self.penalty * abs(nphotos - target) / max(target, 1)
+
+    def optimize(self, photos, num_months=12, photos_per_month=None):
+        """Find layouts and photo assignment for a calendar.
+
+        Args:
+            photos: List with photo filenames to choose from
+            num_months: Number of calendar pages
+            photos_per_month: Average number of photos which should be used per month.
+               If None, as many photos as possible are used (at most four per month).
+        Returns:
+            Tuple with
+            - pics list for create_calendar()
+            - dictionary with default shifts for shiftdict, see build_result()
+            - mean fraction of the photo area which is cropped away
+        """
+        photo_aspects = self.get_aspects(photos)
+        costs = [self.crop_costs(photo_aspects, self.slot_aspects[li], self.slot_areas[li])
+                 for li in range(len(self.layouts))]
+
+        if photos_per_month is None:
+            photos_per_month = min(float(self.num_slots.max()), len(photos) / float(num_months))
+        target = min(len(photos), int(round(photos_per_month * num_months)))
+
+        # start with the same layout for all months, closest to the requested photo number
+        feasible = np.flatnonzero(self.num_slots * num_months <= len(photos))
+        if len(feasible) == 0:
+            print("Not enough photos for {} months".format(num_months))
+            exit(1)
+        start = feasible[np.argmin(np.abs(self.num_slots[feasible] - photos_per_month))]
+        counts = np.zeros(len(self.layouts), dtype=int)
+        counts[start] = num_months
+        best = self.objective(costs, counts, target)
+
+        # local search: move one or two months to another layout
+        moves = [(a, b) for a in range(len(self.layouts)) for b in range(len(self.layouts)) if a != b]
+        for sweep in range(self.max_sweeps):
+            improved = False
+            candidates = [[m] for m in moves] + [[m1, m2] for m1 in moves for m2 in moves
+                                                 if self.num_slots[m1[1]] - self.num_slots[m1[0]]
+                                                 + self.num_slots[m2[1]] - self.num_slots[m2[0]] == 0]
+            for move in candidates:
+                trial = counts.copy()
+                for a, b in move:
+                    trial[a] -= 1
+                    trial[b] += 1
+                if trial.min() < 0:
+                    continue
+                value = self.objective(costs, trial, target)
+                if value < best - 1e-12:
+                    best = value
+                    counts = trial
+                    improved = True
+            if not improved:
+                break
+
+        total, photo_idx, slots = self.assign(costs, counts)
+        return self.build_result(photos, photo_aspects, counts, photo_idx, slots)
+
+    def build_result(self, photos, photo_aspects, counts, photo_idx, slots):
+        """Create the pics list and default shifts from an assignment, see optimize().
+
+        The shifts are not computed from the photo content, they only depend on the
+        direction of the crop. Photos which are cut at the left and right stay centered
+        (shift 0, no entry). Photos which are cut at top and bottom by more than 10% get
+        the shift "vertical_crop_shift", which by default places the upper third line of
+        the photo on the upper third line of the slot, where faces and horizons usually
+        are: with the photo height H and slot height h, the photo then starts (H-h)/3
+        above the slot, which is shift 2/3 - 1 = -1/3 in the scale of get_pic().
+        """
+        # spread the layouts over the year instead of grouping them
+        order = []
+        remaining = counts.copy()
+        while remaining.sum() > 0:
+            for li in np.argsort(-remaining, kind="stable"):
+                if remaining[li] > 0:
+                    order.append(li)
+                    remaining[li] -= 1
+
+        # photos of each layout instance, in the order in which assign() created the slots
+        instances = {li : [] for li in range(len(self.layouts))}
+        pos = 0
+        for li, count in enumerate(counts):
+            for c in range(count):
+                instances[li].append(photo_idx[pos:pos + self.num_slots[li]])
+                pos += self.num_slots[li]
+
+        pics = []
+        shifts = {}
+        cropped = 0.0
+        for li in order:
+            assigned = instances[li].pop(0)
+            layout = self.layouts[li]
+            if type(layout) is not list:
+                monthpics = photos[assigned[0]]
+            else:
+                monthpics = [photos[p] for p in assigned] + [o for o in layout if o in self.calcreator.picoptions]
+            pics.append(monthpics)
+
+            for si, p in enumerate(assigned):
+                ratio = photo_aspects[p] / self.slot_aspects[li][si]
+                cropped += 1.0 - min(ratio, 1.0 / ratio)
+                if ratio < 0.9:
+                    shifts[photos[p]] = self.vertical_crop_shift
+
+        nphotos = max(1, len(photo_idx))
+        return pics, shifts, cropped / nphotos
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+import os
+import json
+import mmap
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+class PictureStore:
+    """Persistent index with content hash, size and rotation of pictures.
+
+    The index maps the absolute path of a picture to its file size, modification time,
+    content hash, dimensions and rotation. As long as size and modification time of a file
+    are unchanged, the file is not read again. Files are hashed through memory mapped I/O,
+    so no copies of the picture data are made in python buffers.
+    """
+
+    def __init__(self, indexfile=".picturestore.json", probe=None, njobs=None):
+        """Open (or create) a picture store.
+
+        Args:
+            indexfile: JSON file where the index is stored. If None, the index is only kept in memory.
+            probe: Function which takes a picture filename and returns the size in pixels as
+               list [width, height] and the rotation in degree, e.g.
+               CalendarCreator.read_image_size_and_rotation. If None, only hashes are stored.
+            njobs: Number of files which are hashed at the same time (default: number of cpus).
+        """
+        self.indexfile = indexfile
+        self.probe = probe
+        self.njobs = njobs if njobs is not None else os.cpu_count()
+        self.chunksize = 64 * 1024 * 1024
+
+        self.index = {}
+        if self.indexfile is not None and os.path.exists(self.indexfile):
+            with open(self.indexfile) as f:
+                self.index = json.load(f)
+
+    def hash_file(self, filename):
+        """Compute the sha256 hash of a file using a memory map.
+
+        Args:
+            filename: Name of file
+        Returns:
+            Hex digest of the file content.
+        """
+        h = hashlib.sha256()
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return h.hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                view = memoryview(m)
+                try:
+                    for start in range(0, len(m), self.chunksize):
+                        h.update(view[start:start+self.chunksize])
+                finally:
+                    view.release()
+        return h.hexdigest()
+
+    def is_current(self, filename):
+        """Check if the index entry of a file is still valid (same size and modification time)."""
+        key = os.path.abspath(filename)
+        if key not in self.index:
+            return False
+        st = os.stat(filename)
+        return self.index[key]["size"] == st.st_size and self.index[key]["mtime"] == st.st_mtime_ns
+
+    def update(self, filenames):
+        """Bring the index entries of the given files up to date.
+
+        Files which are new or changed are hashed in parallel with "njobs" threads. The
+        index is written to "indexfile" afterwards if anything changed.
+
+        Args:
+            filenames: List with picture filenames
+        """
+        todo = []
+        for fn in filenames:
+            if fn not in todo and not self.is_current(fn):
+                todo.append(fn)
+        if len(todo) == 0:
+            return
+
+        if self.njobs <= 1 or len(todo) == 1:
+            entries = [self._scan(fn) for fn in todo]
+        else:
+            with ThreadPoolExecutor(max_workers=self.njobs) as pool:
+                entries = list(pool.map(self._scan, todo))
+
+        for fn, entry in zip(todo, entries):
+            self.index[os.path.abspath(fn)] = entry
+        self.save()
+
+    def get(self, filename):
+        """Get the index entry of a picture.
+
+        Args:
+            filename: Picture filename
+        Returns:
+            Dictionary with the keys "size", "mtime", "hash", "imsize" and "rotation".
+        """
+        self.update([filename])
+        return self.index[os.path.abspath(filename)]
+
+    def get_hash(self, filename):
+        return self.get(filename)["hash"]
+
+    def find_duplicates(self, filenames):
+        """Find pictures which have the same content but are stored under different paths.
+
+        Args:
+            filenames: List with picture filenames
+        Returns:
+            Dictionary with the hash as key and the list of filenames as value. Only hashes
+            with at least two different files are contained.
+        """
+        self.update(filenames)
+        byhash = {}
+        for fn in filenames:
+            paths = byhash.setdefault(self.get_hash(fn), [])
+            if os.path.abspath(fn) not in [os.path.abspath(p) for p in paths]:
+                paths.append(fn)
+        return {h : p for h, p in byhash.items() if len(p) > 1}
+
+    def save(self):
+        """Write the index to "indexfile"."""
+        if self.indexfile is None:
+            return
+        tmpname = self.indexfile + ".tmp"
+        with open(tmpname, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmpname, self.indexfile)
+
+    def _scan(self, filename):
+        st = os.stat(filename)
+        entry = {"size" : st.st_size, "mtime" : st.st_mtime_ns,
+                 "hash" : self.hash_file(filename), "imsize" : None, "rotation" : None}
+        if self.probe is not None:
+            entry["imsize"], entry["rotation"] = self.probe(filename)
+        return entry
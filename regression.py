@@ -0,0 +1,210 @@
+import calendarcreator
+import example
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+REGRESSION_FOLDER = "regression"
+
+
+def get_reference_pics(picfolder):
+    """Picture list using every layout of "picoptions" at least once."""
+    p = [picfolder + os.sep + "p{:02d}.jpg".format(i) for i in range(1, 23)]
+    return [
+        p[0],
+        [p[1], p[2], "vertical"],
+        [p[3], p[4], p[5], "||"],
+        [p[6], p[7], "horizontal"],
+        [p[8], p[9], p[10], "="],
+        [p[11], p[12], p[13], p[14], "||="],
+        [p[15], p[16], p[17], p[18]],
+        None,
+        p[19],
+        [p[20], p[0], "vertical"],
+        p[2],
+        p[3],
+    ]
+
+
+def get_reference_calendars():
+    """Configurations of the reference calendars.
+
+    The "dark" calendar is not reproducible, such that its pages are joined with the
+    merge tool (pdfunite) as in production, while "light" is joined with pikepdf.
+
+    Returns:
+        Dictionary with the name of each reference calendar as key and a dictionary
+        with "theme", "footer_over_pic" and "reproducible" as value.
+    """
+    return {
+        "light" : {"theme" : "light", "footer_over_pic" : True, "reproducible" : True},
+        "dark" : {"theme" : "dark", "footer_over_pic" : False, "reproducible" : False},
+    }
+
+
+def create_reference_creator(njobs, picfolder="pictures"):
+    """Create the CalendarCreator shared by all reference calendars.
+
+    Sharing one instance runs the toolchain preflight (and font cache update) only once.
+    """
+    pagewidth = 23
+    pageheight = 17
+
+    calcreate = calendarcreator.CalendarCreator()
+    calcreate.set_margin(0.3)
+    calcreate.set_page_size(pagewidth, pageheight)
+    calcreate.set_title(r"Calendar 2023", picfolder + os.sep + "p22.jpg", [0.9, pageheight/2.0], "north west")
+    calcreate.set_shiftdict(example.get_shift_dictionary(picfolder))
+    calcreate.set_citations(example.get_citations(), {"fill" : "white", "opacity" : 0.7, "font size" : r"\normalsize"})
+    calcreate.set_legends(example.get_legends(pagewidth), {"font size" : r"\footnotesize", "align" : "right"})
+    calcreate.njobs = njobs
+    return calcreate
+
+
+def build_reference(calcreate, name, config, buildfolder, picfolder="pictures"):
+    """Build one reference calendar.
+
+    Args:
+        calcreate: CalendarCreator from create_reference_creator()
+    Returns:
+        Filename of the calendar pdf
+    """
+    calcreate.theme = config["theme"]
+    calcreate.footer_over_pic = config["footer_over_pic"]
+    calcreate.set_reproducible(0 if config["reproducible"] else None)
+
+    calcreate.texfolder = buildfolder + os.sep + name + "_tex"
+    calcreate.calendar_filename = buildfolder + os.sep + name + ".pdf"
+    calcreate.create_calendar(get_reference_pics(picfolder), 2023, 1)
+    return calcreate.calendar_filename
+
+
+def rasterize_page(pdfname, page, outname, dpi):
+    """Render one page of a pdf to a png file with pdftoppm."""
+    subprocess.check_call(["pdftoppm", "-r", str(dpi), "-f", str(page), "-l", str(page),
+                           "-png", "-singlefile", pdfname, outname.replace(".png", "")])
+    return outname
+
+
+def compare_images(name, golden, tolerance):
+    """Compare a rendered page with its golden image.
+
+    Args:
+        name: png file of the rendered page
+        golden: png file of the golden image
+        tolerance: Dictionary with "mean" (maximum mean absolute difference, 0-255),
+           "pixel" (difference above which a pixel counts as changed) and "changed"
+           (maximum fraction of changed pixels)
+    Returns:
+        Tuple with (ok, mean absolute difference, fraction of changed pixels), where ok
+        is None if there is no golden image
+    """
+    if not os.path.exists(golden):
+        return None, None, None
+    a = np.asarray(Image.open(name).convert("RGB"), dtype=np.int16)
+    b = np.asarray(Image.open(golden).convert("RGB"), dtype=np.int16)
+    if a.shape != b.shape:
+        return False, None, None
+    diff = np.abs(a - b).max(axis=2)
+    mean = float(diff.mean())
+    changed = float((diff > tolerance["pixel"]).mean())
+    return mean <= tolerance["mean"] and changed <= tolerance["changed"], mean, changed
+
+
+def run(update, njobs, dpi, tolerance):
+    """Build all reference calendars, render them and compare them to the golden images.
+
+    Returns:
+        True if all pages match, None if there are no golden images yet
+    """
+    buildfolder = REGRESSION_FOLDER + os.sep + "build"
+    goldenfolder = REGRESSION_FOLDER + os.sep + "golden"
+    if os.path.exists(buildfolder):
+        shutil.rmtree(buildfolder)
+    os.makedirs(buildfolder)
+    os.makedirs(goldenfolder, exist_ok=True)
+
+    calcreate = create_reference_creator(njobs)
+    # the preflight of the first (reproducible) calendar does not check the merge tool
+    for tool in ["pdftoppm", calcreate.merge_tool]:
+        if shutil.which(tool) is None:
+            print("Required program not found: " + tool)
+            sys.exit(1)
+
+    start = time.perf_counter()
+    calendars = {}
+    for name, config in get_reference_calendars().items():
+        calendars[name] = build_reference(calcreate, name, config, buildfolder)
+    t_build = time.perf_counter() - start
+
+    # one png per page, all pages of all calendars are rendered in parallel
+    start = time.perf_counter()
+    jobs = []
+    npages = len(get_reference_pics("pictures")) + 1
+    for name, pdfname in calendars.items():
+        for page in range(1, npages + 1):
+            jobs.append((name, page, buildfolder + os.sep + "{}_page{:02d}.png".format(name, page)))
+    with ThreadPoolExecutor(max_workers=njobs) as pool:
+        list(pool.map(lambda j: rasterize_page(calendars[j[0]], j[1], j[2], dpi), jobs))
+    t_render = time.perf_counter() - start
+
+    if update:
+        for name, page, pngname in jobs:
+            shutil.copy(pngname, goldenfolder + os.sep + os.path.basename(pngname))
+        print("Updated {} golden images".format(len(jobs)))
+        return True
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=njobs) as pool:
+        results = list(pool.map(lambda j: compare_images(
+            j[2], goldenfolder + os.sep + os.path.basename(j[2]), tolerance), jobs))
+    t_compare = time.perf_counter() - start
+
+    if all([r[0] is None for r in results]):
+        print("No baseline: there are no golden images in {}, run with --update to create them".format(
+            goldenfolder))
+        return None
+
+    ok = True
+    for (name, page, pngname), (match, mean, changed) in zip(jobs, results):
+        if match is None:
+            print("FAIL {}: no golden image, run with --update if the page is new".format(
+                os.path.basename(pngname)))
+        elif mean is None:
+            print("FAIL {}: golden image has a different size".format(os.path.basename(pngname)))
+        elif not match:
+            print("FAIL {}: mean difference {:.2f}, {:.2%} changed pixels".format(
+                os.path.basename(pngname), mean, changed))
+        ok = ok and match is True
+
+    print("{} pages: build {:.1f} s, render {:.1f} s, compare {:.2f} s -> {}".format(
+        len(jobs), t_build, t_render, t_compare, "ok" if ok else "FAILED"))
+    return ok
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Visual regression test of rendered calendar pages")
+    parser.add_argument("--update", action="store_true", help="store the rendered pages as new golden images")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--dpi", type=int, default=40)
+    parser.add_argument("--max-mean", type=float, default=1.0,
+                        help="maximum mean absolute pixel difference (0-255)")
+    parser.add_argument("--pixel-threshold", type=int, default=48,
+                        help="pixel difference above which a pixel counts as changed")
+    parser.add_argument("--max-changed", type=float, default=0.002,
+                        help="maximum fraction of changed pixels")
+    args = parser.parse_args()
+
+    tolerance = {"mean" : args.max_mean, "pixel" : args.pixel_threshold, "changed" : args.max_changed}
+    result = run(args.update, args.jobs, args.dpi, tolerance)
+    if result is None:
+        sys.exit(2)
+    elif not result:
+        sys.exit(1)
@@ -0,0 +1,20 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def page_pdfs(tmp_path):
+    """Function which writes small single page PDFs with pictures of different colors."""
+    from PIL import Image
+
+    def make(num_pages):
+        pages = []
+        for i in range(num_pages):
+            filename = str(tmp_path / "page{:02d}.pdf".format(i))
+            Image.new("RGB", (200, 150), (40 * i % 256, 80, 160)).save(filename, resolution=72)
+            pages.append(filename)
+        return pages
+    return make
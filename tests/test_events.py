@@ -0,0 +1,100 @@
+import datetime
+import pytest
+import events
+
+D = datetime.date
+
+
+def ical(*vevents):
+    lines = ["BEGIN:VCALENDAR"]
+    for props in vevents:
+        lines += ["BEGIN:VEVENT"] + list(props) + ["END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines) + "\r\n"
+
+
+def expand_all(cal, parsed):
+    return sorted([d for first, name, cat, rule in parsed for d in cal.expand(first, rule)])
+
+
+def test_single_and_multi_day_events():
+    cal = events.EventCalendar(2024, 2024, cachefolder=None)
+    parsed = cal.parse_ical(ical(
+        ["DTSTART;VALUE=DATE:20240501", "SUMMARY:Maifeiertag", "CATEGORIES:Holiday"],
+        ["DTSTART;VALUE=DATE:20240729", "DTEND;VALUE=DATE:20240801", "SUMMARY:Urlaub"]))
+    assert parsed[0] == (D(2024, 5, 1), "Maifeiertag", "holiday", None)
+    assert expand_all(cal, parsed) == [D(2024, 5, 1), D(2024, 7, 29), D(2024, 7, 30), D(2024, 7, 31)]
+
+
+def test_yearly_byday_bymonth():
+    # Muttertag: second sunday in may
+    cal = events.EventCalendar(2024, 2025, cachefolder=None)
+    parsed = cal.parse_ical(ical(
+        ["DTSTART;VALUE=DATE:20100509", "SUMMARY:Muttertag", "RRULE:FREQ=YEARLY;BYMONTH=5;BYDAY=2SU"]))
+    assert expand_all(cal, parsed) == [D(2024, 5, 12), D(2025, 5, 11)]
+
+
+def test_monthly_last_weekday_and_monthday():
+    cal = events.EventCalendar(2024, 2024, cachefolder=None)
+    parsed = cal.parse_ical(ical(
+        ["DTSTART;VALUE=DATE:20240129", "SUMMARY:Last monday", "RRULE:FREQ=MONTHLY;BYDAY=-1MO;COUNT=3"],
+        ["DTSTART;VALUE=DATE:20241030", "SUMMARY:Last day", "RRULE:FREQ=MONTHLY;BYMONTHDAY=-1"]))
+    assert expand_all(cal, parsed) == [D(2024, 1, 29), D(2024, 2, 26), D(2024, 3, 25),
+                                       D(2024, 10, 31), D(2024, 11, 30), D(2024, 12, 31)]
+
+
+def test_weekly_with_exdate():
+    cal = events.EventCalendar(2024, 2024, cachefolder=None)
+    parsed = cal.parse_ical(ical(
+        ["DTSTART;VALUE=DATE:20240902", "SUMMARY:Training",
+         "RRULE:FREQ=WEEKLY;BYDAY=MO,TH;UNTIL=20240916",
+         "EXDATE;VALUE=DATE:20240905", "EXDATE;VALUE=DATE:20240909,20240912"]))
+    assert expand_all(cal, parsed) == [D(2024, 9, 2), D(2024, 9, 16)]
+
+
+def test_interval_and_count():
+    cal = events.EventCalendar(2023, 2030, cachefolder=None)
+    # 29th of february does not exist in 2022 and 2026, which is not counted
+    rule = cal._make_rule("yearly", interval=2, count=3)
+    assert cal.expand(D(2020, 2, 29), rule) == [D(2024, 2, 29), D(2028, 2, 29)]
+    rule = cal._make_rule("monthly", count=4)
+    assert cal.expand(D(2023, 1, 31), rule) == [D(2023, 1, 31), D(2023, 3, 31), D(2023, 5, 31), D(2023, 7, 31)]
+
+
+def test_unsupported_and_invalid_rules_are_skipped(capsys):
+    cal = events.EventCalendar(2024, 2024, cachefolder=None)
+    parsed = cal.parse_ical(ical(
+        ["DTSTART;VALUE=DATE:20240101", "SUMMARY:Setpos", "RRULE:FREQ=MONTHLY;BYDAY=MO,TU;BYSETPOS=-1"],
+        ["DTSTART;VALUE=DATE:20240101", "SUMMARY:Zero", "RRULE:FREQ=DAILY;INTERVAL=0"],
+        ["DTSTART;VALUE=DATE:20240101", "SUMMARY:Ok", "RRULE:FREQ=YEARLY"]))
+    assert [p[1] for p in parsed] == ["Ok"]
+    out = capsys.readouterr().out
+    assert "BYSETPOS" in out and "INTERVAL" in out
+
+    with pytest.raises(ValueError):
+        cal.expand(D(2024, 1, 1), {"freq" : "daily", "interval" : 0, "count" : None, "until" : None})
+
+
+def test_csv_repeat():
+    cal = events.EventCalendar(2024, 2025, cachefolder=None)
+    parsed = cal.parse_csv("date,name,category,repeat\n1990-06-03,Anna,birthday,yearly\n2024-12-24,Heiligabend,,\n")
+    assert expand_all(cal, parsed) == [D(2024, 6, 3), D(2024, 12, 24), D(2025, 6, 3)]
+
+    with pytest.raises(SystemExit):
+        cal.parse_csv("date,name,repeat\n1990-06-03,Anna,annually\n")
+
+
+def test_cache_roundtrip(tmp_path):
+    filename = tmp_path / "feed.ics"
+    filename.write_text(ical(
+        ["DTSTART;VALUE=DATE:20100509", "SUMMARY:Muttertag", "RRULE:FREQ=YEARLY;BYMONTH=5;BYDAY=2SU;UNTIL=20300101",
+         "EXDATE;VALUE=DATE:20250511"]))
+    cachefolder = str(tmp_path / "cache")
+
+    found = []
+    for i in range(2):
+        cal = events.EventCalendar(2024, 2025, cachefolder=cachefolder)
+        cal.load(str(filename), category="holiday")
+        found.append(cal.get_range(D(2024, 1, 1), D(2025, 12, 31)))
+    assert found[0] == found[1]
+    assert list(found[0].keys()) == [D(2024, 5, 12)]
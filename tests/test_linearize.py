@@ -0,0 +1,95 @@
+import os
+import re
+import struct
+import pytest
+import calendarcreator
+
+pikepdf = pytest.importorskip("pikepdf")
+
+
+def get_linearization_info(filename):
+    """Read and check the linearization dictionary and page offset hint table of a pdf.
+
+    Args:
+        filename: pdf file
+    Returns:
+        None if the file is not a valid linearized pdf, otherwise a dictionary with the
+        entries of the linearization dictionary (L, H, O, E, N, T) and the header of the
+        page offset hint table ("hint_first_page_offset", "hint_least_page_length",
+        "hint_least_objects_per_page").
+    """
+    with open(filename, "rb") as f:
+        start = f.read(1024)
+    size = os.path.getsize(filename)
+
+    # the linearization dictionary must be the first object in the file
+    match = re.search(rb"^%PDF-\d\.\d.*?\d+\s+\d+\s+obj\s*<<(.*?)>>", start, re.DOTALL)
+    if match is None or b"/Linearized" not in match.group(1):
+        return None
+    entries = match.group(1)
+
+    info = {}
+    for key in ["L", "O", "E", "N", "T"]:
+        val = re.search(rb"/" + key.encode() + rb"\s+(\d+)", entries)
+        if val is None:
+            return None
+        info[key] = int(val.group(1))
+    hint = re.search(rb"/H\s*\[\s*(\d+)\s+(\d+)", entries)
+    if hint is None:
+        return None
+    info["H"] = [int(hint.group(1)), int(hint.group(2))]
+
+    if info["L"] != size or info["H"][0] + info["H"][1] > size or info["E"] > size:
+        return None
+
+    with pikepdf.open(filename) as pdf:
+        if info["N"] != len(pdf.pages) or not pdf.is_linearized:
+            return None
+
+        # read the primary hint stream, which starts at the offset given in /H
+        with open(filename, "rb") as f:
+            f.seek(info["H"][0])
+            objhead = re.match(rb"\s*(\d+)\s+(\d+)\s+obj", f.read(64))
+        if objhead is None:
+            return None
+        hints = pdf.get_object(int(objhead.group(1)), int(objhead.group(2)))
+        data = hints.read_bytes()
+        if len(data) < 36 or "/S" not in hints:
+            return None
+
+        # header of the page offset hint table (PDF reference, table F.3)
+        least_objects, first_page_offset = struct.unpack(">II", data[0:8])
+        least_page_length = struct.unpack(">I", data[10:14])[0]
+        if first_page_offset >= size or least_page_length == 0:
+            return None
+        info["hint_least_objects_per_page"] = least_objects
+        info["hint_first_page_offset"] = first_page_offset
+        info["hint_least_page_length"] = least_page_length
+    return info
+
+
+def test_join_pages_linearized(tmp_path, page_pdfs):
+    pages = page_pdfs(4)
+    calcreate = calendarcreator.CalendarCreator()
+    calcreate.set_reproducible()
+
+    filename = str(tmp_path / "calendar.pdf")
+    calcreate.join_pages(pages, filename, linearize=True)
+
+    info = get_linearization_info(filename)
+    assert info is not None
+    assert info["N"] == 4
+    assert info["L"] == os.path.getsize(filename)
+    assert info["E"] <= info["L"]
+    assert info["hint_least_objects_per_page"] > 0
+    assert info["hint_least_page_length"] > 0
+
+
+def test_join_pages_not_linearized(tmp_path, page_pdfs):
+    calcreate = calendarcreator.CalendarCreator()
+    calcreate.set_reproducible()
+
+    filename = str(tmp_path / "calendar.pdf")
+    calcreate.join_pages(page_pdfs(2), filename)
+
+    assert get_linearization_info(filename) is None
@@ -0,0 +1,48 @@
+import os
+import shutil
+import hashlib
+import pytest
+import calendarcreator
+
+pytest.importorskip("pikepdf")
+
+
+def sha256(filename):
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_join_pages_reproducible(tmp_path, page_pdfs):
+    pages = page_pdfs(4)
+    calcreate = calendarcreator.CalendarCreator()
+    calcreate.set_reproducible()
+
+    first = str(tmp_path / "first.pdf")
+    second = str(tmp_path / "second.pdf")
+    calcreate.join_pages(pages, first)
+    calcreate.join_pages(pages, second)
+
+    assert sha256(first) == sha256(second)
+
+
+@pytest.mark.skipif(shutil.which("lualatex") is None, reason="needs lualatex")
+def test_pages_reproducible(tmp_path):
+    from PIL import Image
+
+    picname = str(tmp_path / "picture.jpg")
+    Image.new("RGB", (600, 400), (200, 120, 40)).save(picname, quality=90)
+
+    # build in two different folders, like the temporary folders of scratch builds
+    hashes = []
+    for build in ["first", "second"]:
+        calcreate = calendarcreator.CalendarCreator()
+        calcreate.set_reproducible()
+        calcreate.memory_stats_file = None
+        calcreate.set_title("Calendar 2024", picname, [1.0, 5.0], "north west")
+        calcreate.texfolder = str(tmp_path / build)
+        os.mkdir(calcreate.texfolder)
+        pages = [calcreate.create_titlepage(2024),
+                 calcreate.create_page(2024, "Januar", picname)]
+        hashes.append([sha256(p) for p in pages])
+
+    assert hashes[0] == hashes[1]